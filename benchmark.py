@@ -0,0 +1,374 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+from catalog import FILTRI, full_params
+from filters import PRECISION_FILTERS, PRECISIONS, apply_filter_to_channels
+
+
+DIMENSIONI = [256, 512, 1024, 2048]
+KERNEL = [3, 7, 15]
+TIPI = ["uint8", "float32"]
+MODI = ["rgb", "gray"]
+
+# Parametri fissi per i filtri che li richiedono oltre alla finestra
+PARAMETRI_EXTRA = {"Filtro Bilaterale Veloce": {"tolerance": 1.0}, "Filtro Non-Local Means Veloce": {"search_step": 2}}
+
+# Budget di avvio per l'uso da riga di comando e come libreria: millisecondi
+# di import (cumulativi, da python -X importtime) e moduli pesanti che non
+# devono essere caricati
+BUDGET_AVVIO = {
+    "catalog": (30, ("numpy", "PIL", "multiprocessing")),
+    "cli": (60, ("numpy", "PIL", "multiprocessing", "concurrent.futures.process")),
+    "filters": (250, ("PIL", "tkinter", "multiprocessing")),
+    "pipeline": (250, ("PIL", "tkinter", "multiprocessing", "yaml")),
+    "gui": (80, ("numpy", "PIL", "filters", "multiprocessing")),
+}
+
+# Casi piccoli (anche dispari e con finestre pari) per i risultati di riferimento
+DIMENSIONI_RIFERIMENTO = [64, 97]
+KERNEL_RIFERIMENTO = [3, 4, 7, 15]
+
+
+def _sample_path(path=None):
+    if path:
+        return path
+    immagini = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "images", "*")))
+    if not immagini:
+        raise FileNotFoundError("Nessuna immagine di esempio in images/")
+    return immagini[0]
+
+
+_immagini = {}
+
+
+def test_image(size, mode, dtype, path=None):
+    """
+    Immagine di prova size x size ricavata da un'immagine di esempio
+    (ridimensionata; "gray" in scala di grigi), nel tipo richiesto.
+    """
+    key = (size, mode, path)
+    if key not in _immagini:
+        image = Image.open(_sample_path(path)).convert("L" if mode == "gray" else "RGB")
+        _immagini[key] = np.asarray(image.resize((size, size), Image.BICUBIC))
+    return _immagini[key].astype(dtype)
+
+
+def cases(filtri, kernel_sizes, precision=None):
+    """
+    Combinazioni (nome, params) da misurare: ogni filtro del catalogo con ogni
+    finestra (kernel_size, max_kernel_size che parte da 3, o la finestra di
+    ricerca search_size del non-local means). Con precision
+    vengono misurati solo i filtri che la ammettono.
+    """
+    for nome in filtri:
+        func = FILTRI[nome]["func"]
+        if precision is not None and precision not in PRECISION_FILTERS.get(func, ()):
+            continue
+        defaults = full_params(func, {})
+        for k in kernel_sizes:
+            params = dict(PARAMETRI_EXTRA.get(nome, {}))
+            if precision is not None:
+                params["precision"] = precision
+            if "max_kernel_size" in defaults:
+                if k < 3:
+                    continue
+                params["max_kernel_size"] = k
+            elif "kernel_size" in defaults:
+                params["kernel_size"] = k
+            elif "search_size" in defaults:
+                params["search_size"] = k
+            yield nome, params
+
+
+def run_filter(image, nome, params):
+    func = FILTRI[nome]["func"]
+    if image.ndim == 2:
+        return func(image, **params)
+    return apply_filter_to_channels(image, func, **params)
+
+
+def measure(image, nome, params, repeat):
+    """
+    Esegue il filtro una volta con tracemalloc (picco di memoria allocata,
+    fa anche da riscaldamento) e poi `repeat` volte senza, tenendo il tempo
+    migliore. Le ripetizioni si fermano prima se una singola esecuzione
+    supera 2 secondi.
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    run_filter(image, nome, params)
+    first = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat if first < 2.0 else 1):
+        start = time.perf_counter()
+        run_filter(image, nome, params)
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {"seconds": best, "pixels_per_sec": image.size / best, "peak_bytes": int(peak), "runs": len(times)}
+
+
+def case_id(nome, params, size, mode, dtype):
+    return f"{nome}|{json.dumps(params, sort_keys=True)}|{size}|{mode}|{dtype}"
+
+
+def comando_run(args):
+    risultati = []
+    # Una volta superato il budget, le dimensioni maggiori dello stesso caso si saltano
+    oltre_budget = set()
+    for nome, params in cases(args.filtri, args.kernel, args.precision):
+        for dtype in args.dtype:
+            for mode in args.mode:
+                for size in sorted(args.sizes):
+                    gruppo = (nome, json.dumps(params, sort_keys=True), dtype, mode)
+                    record = {"id": case_id(nome, params, size, mode, dtype), "filter": nome, "params": params,
+                              "size": size, "mode": mode, "dtype": dtype}
+                    if gruppo in oltre_budget:
+                        record["skipped"] = f"oltre il budget di {args.budget} s"
+                    else:
+                        record.update(measure(test_image(size, mode, dtype, args.image), nome, params, args.repeat))
+                        if record["seconds"] > args.budget:
+                            oltre_budget.add(gruppo)
+                    risultati.append(record)
+                    if "skipped" not in record:
+                        print(f"{nome:<26} {json.dumps(params):<32} {size:>5} {mode:>4} {dtype:>7} "
+                              f"{record['seconds']:>9.4f} s {record['pixels_per_sec'] / 1e6:>9.2f} Mpx/s "
+                              f"{record['peak_bytes'] / 2**20:>8.1f} MB")
+
+    data = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "image": _sample_path(args.image),
+        },
+        "results": risultati,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    print(f"Risultati salvati in {args.out}")
+    return 0
+
+
+def compare(base, new, threshold):
+    """
+    Confronta due file di risultati: restituisce le righe (id, pixel/s prima,
+    pixel/s dopo, rapporto) dei casi comuni e la lista delle regressioni,
+    cioè dei casi più lenti di oltre `threshold` (0.1 = 10%).
+    """
+    before = {r["id"]: r for r in base["results"] if "skipped" not in r}
+    righe, regressioni = [], []
+    for r in new["results"]:
+        if "skipped" in r or r["id"] not in before:
+            continue
+        ratio = r["pixels_per_sec"] / before[r["id"]]["pixels_per_sec"]
+        righe.append((r["id"], before[r["id"]]["pixels_per_sec"], r["pixels_per_sec"], ratio))
+        if ratio < 1 - threshold:
+            regressioni.append(r["id"])
+    return righe, regressioni
+
+
+def comando_compare(args):
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    righe, regressioni = compare(base, new, args.threshold)
+    for case, prima, dopo, ratio in righe:
+        esito = "REGRESSIONE" if case in regressioni else ""
+        print(f"{case:<70} {prima / 1e6:>9.2f} → {dopo / 1e6:>9.2f} Mpx/s {ratio:>6.2f}x {esito}")
+    print(f"{len(righe)} casi confrontati, {len(regressioni)} regressioni oltre il {args.threshold:.0%}")
+    return 1 if regressioni else 0
+
+
+def comando_reference(args):
+    """
+    Salva in un .npz ingressi e uscite di casi piccoli, da usare con check
+    per verificare che un'ottimizzazione non cambi i risultati.
+    """
+    arrays = {}
+    for nome, params in cases(args.filtri, KERNEL_RIFERIMENTO):
+        for dtype in TIPI:
+            for mode in MODI:
+                for size in DIMENSIONI_RIFERIMENTO:
+                    image = test_image(size, mode, dtype, args.image)
+                    key = case_id(nome, params, size, mode, dtype)
+                    arrays["input " + key] = image
+                    arrays["output " + key] = run_filter(image, nome, params)
+    np.savez_compressed(args.refs, **arrays)
+    print(f"{len(arrays) // 2} risultati di riferimento salvati in {args.refs}")
+    return 0
+
+
+def comando_check(args):
+    """
+    Ricalcola i casi di riferimento e li confronta con quelli salvati:
+    uguaglianza esatta, oppure differenza massima entro --tolerance.
+    """
+    refs = np.load(args.refs)
+    errori = 0
+    for key in refs.files:
+        if not key.startswith("output "):
+            continue
+        case = key[len("output "):]
+        nome, params = case.split("|")[0], json.loads(case.split("|")[1])
+        if nome not in args.filtri:
+            continue
+        expected = refs[key]
+        result = run_filter(refs["input " + case], nome, params)
+        if result.shape != expected.shape or result.dtype != expected.dtype:
+            print(f"DIVERSO {case}: {result.dtype}{result.shape} invece di {expected.dtype}{expected.shape}")
+            errori += 1
+            continue
+        diff = np.abs(result.astype(np.float64) - expected.astype(np.float64))
+        if diff.max(initial=0) > args.tolerance:
+            print(f"DIVERSO {case}: differenza massima {diff.max():.6g}, {np.count_nonzero(diff > args.tolerance)} pixel")
+            errori += 1
+    print("Tutti i risultati coincidono" if not errori else f"{errori} casi diversi dai riferimenti")
+    return 1 if errori else 0
+
+
+def _costante_resta_costante():
+    # Gaussiano (e media) con kernel grandi, dove convolve sceglierebbe la FFT:
+    # un'immagine piatta non deve perdere un livello nel troncamento
+    from filters import gaussian_filter, mean_filter
+    for valore, forma, k in ((200, (512, 512), 41), (100, (300, 40), 31), (255, (128, 128), 61)):
+        image = np.full(forma, valore, dtype=np.uint8)
+        for nome, uscita in (("gaussiano", gaussian_filter(image, k)), ("gaussiano sigma k/4", gaussian_filter(image, k, k / 4)),
+                             ("media", mean_filter(image, k))):
+            if uscita.min() != valore or uscita.max() != valore:
+                return f"{nome} k={k} su {valore} costante: valori {np.unique(uscita)[:5]}"
+    return None
+
+
+def _anteprima_piramidale_filtra():
+    # Alla scala tipica del proxy (~0.09) i filtri piramidali devono ancora
+    # filtrare: livelli e finestre scalati insieme, non una finestra 1x1
+    from filters import pyramid_gaussian_filter, pyramid_median_filter
+    from preview import scale_params
+    proxy = np.random.default_rng(0).integers(0, 256, (350, 350), dtype=np.uint8)
+    for func in (pyramid_median_filter, pyramid_gaussian_filter):
+        for params in ({"kernel_size": 5, "levels": 3}, {"kernel_size": 5, "levels": 5, "level_params": {"0": None}}):
+            scalati = scale_params(func, params, 0.0875)
+            cambiati = np.count_nonzero(func(proxy, **scalati) != proxy)
+            if cambiati < proxy.size // 2:
+                return f"{func.__name__} {params} → {scalati}: cambiati solo {cambiati} pixel su {proxy.size}"
+    return None
+
+
+# Proprietà che devono valere in ogni versione (regressioni già trovate):
+# funzioni che restituiscono None oppure la descrizione del problema
+INVARIANTI = {
+    "immagine costante con kernel grandi": _costante_resta_costante,
+    "anteprima dei filtri piramidali": _anteprima_piramidale_filtra,
+}
+
+
+def comando_invarianti(args):
+    errori = 0
+    for nome, verifica in INVARIANTI.items():
+        problema = verifica()
+        print(f"{nome}: {problema or 'ok'}")
+        errori += problema is not None
+    return 1 if errori else 0
+
+
+def import_time(modulo):
+    """
+    Tempo di import (ms, cumulativo) di un modulo in un interprete nuovo e
+    nomi dei moduli importati con lui, da python -X importtime.
+    """
+    cartella = os.path.dirname(os.path.abspath(__file__))
+    uscita = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"], cwd=cartella,
+                            capture_output=True, text=True, check=True).stderr
+    tempi = {}
+    for riga in uscita.splitlines():
+        if riga.startswith("import time:") and "|" in riga and "self [us]" not in riga:
+            _, cumulativo, nome = riga.split("|")
+            tempi[nome.strip()] = int(cumulativo) / 1000
+    return tempi[modulo], set(tempi)
+
+
+def comando_startup(args):
+    errori = 0
+    for modulo, (budget, vietati) in BUDGET_AVVIO.items():
+        misure = [import_time(modulo) for _ in range(args.repeat)]
+        ms = min(m for m, _ in misure)
+        caricati = sorted(m for m in vietati if any(n == m or n.startswith(m + ".") for n in misure[0][1]))
+        problemi = ([f"oltre {budget} ms"] if ms > budget else []) + [f"importa {m}" for m in caricati]
+        print(f"{modulo}: {ms:.1f} ms (budget {budget} ms) {'; '.join(problemi) or 'ok'}")
+        errori += bool(problemi)
+    return 1 if errori else 0
+
+
+def _lista(tipo):
+    return lambda testo: [tipo(v) for v in testo.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark e verifica dei risultati dei filtri del catalogo")
+    parser.add_argument("--image", help="immagine di esempio (default: la prima in images/)")
+    parser.add_argument("--filtri", type=lambda t: t.split(";"), default=list(FILTRI),
+                        help='nomi del catalogo separati da ";" (default: tutti)')
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    run = sub.add_parser("run", help="misura tempi, pixel/s e memoria e salva i risultati in JSON")
+    run.add_argument("--sizes", type=_lista(int), default=DIMENSIONI, help="lati delle immagini, es. 256,1024,8192")
+    run.add_argument("--kernel", type=_lista(int), default=KERNEL)
+    run.add_argument("--dtype", type=_lista(str), default=TIPI)
+    run.add_argument("--mode", type=_lista(str), default=MODI, help="rgb, gray")
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--precision", choices=PRECISIONS,
+                     help="misura media, gaussiano e bilaterale con questa precisione")
+    run.add_argument("--budget", type=float, default=60.0,
+                     help="secondi oltre i quali le dimensioni maggiori dello stesso caso vengono saltate")
+    run.add_argument("-o", "--out", default="benchmark.json")
+
+    cmp_ = sub.add_parser("compare", help="confronta due risultati; esce con 1 se ci sono regressioni")
+    cmp_.add_argument("base")
+    cmp_.add_argument("new")
+    cmp_.add_argument("--threshold", type=float, default=0.10, help="calo di pixel/s tollerato (0.10 = 10%%)")
+
+    ref = sub.add_parser("reference", help="salva i risultati di riferimento")
+    ref.add_argument("--refs", default="benchmark_reference.npz")
+
+    chk = sub.add_parser("check", help="confronta i risultati attuali con quelli di riferimento")
+    chk.add_argument("--refs", default="benchmark_reference.npz")
+    chk.add_argument("--tolerance", type=float, default=0.0, help="differenza massima ammessa per pixel")
+
+    avvio = sub.add_parser("startup", help="misura il tempo di import dei moduli (-X importtime) rispetto al budget; "
+                                           "esce con 1 se qualcuno lo supera")
+    avvio.add_argument("--repeat", type=int, default=5, help="misure per modulo (vale la più veloce)")
+
+    sub.add_parser("invarianti", help="verifica le proprietà in INVARIANTI (regressioni già trovate); "
+                                      "esce con 1 se qualcuna non vale")
+
+    args = parser.parse_args(argv)
+    sconosciuti = set(args.filtri) - set(FILTRI)
+    if sconosciuti:
+        parser.error(f"Filtri sconosciuti: {', '.join(sorted(sconosciuti))}")
+    comandi = {"run": comando_run, "compare": comando_compare, "reference": comando_reference, "check": comando_check,
+                "startup": comando_startup, "invarianti": comando_invarianti}
+    return comandi[args.comando](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import argparse
+import time
+
+from filters import apply_filter_to_channels, bilateral_filter
+from utils import load_image, psnr
+
+
+# Configurazioni (kernel_size, sigma_spatial) e tolleranze della griglia bilaterale
+CONFIGURAZIONI = [(5, 2.0), (9, 3.0), (15, 5.0)]
+TOLLERANZE = [0.5, 1.0, 2.0]
+
+
+def cronometra(image, **params):
+    start = time.perf_counter()
+    result = apply_filter_to_channels(image, bilateral_filter, **params)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Velocità e PSNR del filtro bilaterale approssimato rispetto a quello esatto")
+    parser.add_argument("--image", default="images/balloons_noisy.png")
+    parser.add_argument("--sigma-intensity", type=float, default=30.0)
+    args = parser.parse_args()
+
+    image = load_image(args.image)
+    print(f"Immagine: {args.image} {image.shape}")
+    print(f"{'kernel':>6} {'σ_spaz':>6} {'toll.':>6} {'tempo (s)':>10} {'speedup':>8} {'PSNR (dB)':>10}")
+
+    for kernel_size, sigma_spatial in CONFIGURAZIONI:
+        params = {"kernel_size": kernel_size, "sigma_spatial": sigma_spatial, "sigma_intensity": args.sigma_intensity}
+        exact, exact_time = cronometra(image, **params)
+        print(f"{kernel_size:>6} {sigma_spatial:>6} {'esatto':>6} {exact_time:>10.3f} {1.0:>8.1f} {'∞':>10}")
+
+        for tolerance in TOLLERANZE:
+            approx, approx_time = cronometra(image, tolerance=tolerance, **params)
+            print(f"{kernel_size:>6} {sigma_spatial:>6} {tolerance:>6} {approx_time:>10.3f} "
+                  f"{exact_time / approx_time:>8.1f} {psnr(exact, approx):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import os
+import time
+
+from filters import bilateral_filter, median_filter
+from parallel import apply_parallel
+from tiling import apply_chain
+from utils import load_image
+
+
+# Catena di prova: abbastanza pesante da rendere trascurabile l'avvio del pool
+CATENA = [
+    ("Filtro Mediano", median_filter, {"kernel_size": 5}),
+    ("Filtro Bilaterale", bilateral_filter, {"kernel_size": 9, "sigma_spatial": 3.0, "sigma_intensity": 30.0}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scalabilità di apply_parallel al variare dei worker")
+    parser.add_argument("--image", default="images/input.jpg")
+    parser.add_argument("--backend", choices=["process", "thread"], default="process")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    image = load_image(args.image)
+    print(f"Immagine: {args.image} {image.shape}, backend: {args.backend}, core: {os.cpu_count()}")
+
+    start = time.perf_counter()
+    reference = apply_chain(image, CATENA)
+    serial_time = time.perf_counter() - start
+    print(f"{'worker':>6} {'tempo (s)':>10} {'speedup':>8} {'efficienza':>10}")
+    print(f"{'seriale':>6} {serial_time:>10.3f} {1.0:>8.2f} {'':>10}")
+
+    workers = 1
+    while workers <= args.max_workers:
+        start = time.perf_counter()
+        result = apply_parallel(image, CATENA, workers=workers, backend=args.backend)
+        elapsed = time.perf_counter() - start
+        if not (result == reference).all():
+            raise RuntimeError(f"Risultato diverso dal seriale con {workers} worker")
+        speedup = serial_time / elapsed
+        print(f"{workers:>6} {elapsed:>10.3f} {speedup:>8.2f} {speedup / workers:>10.0%}")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from catalog import full_params
+from filters import apply_filter_to_channels
+from profiling import measure
+
+
+# Da incrementare quando cambia il risultato di un filtro: invalida le cache su disco
+CACHE_VERSION = 1
+
+
+def image_key(image):
+    """
+    Chiave di contenuto di un'immagine (forma, tipo e pixel).
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{image.shape}|{image.dtype.str}".encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+def stage_key(upstream_key, nome, params):
+    """
+    Chiave del risultato di uno stadio: dipende dalla chiave dello stadio
+    precedente (o dell'immagine), dal filtro e dai suoi parametri.
+    """
+    descrizione = json.dumps([CACHE_VERSION, upstream_key, nome, params], sort_keys=True, default=str)
+    return hashlib.blake2b(descrizione.encode(), digest_size=20).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache dei risultati intermedi indicizzata per contenuto.
+    In memoria tiene al massimo max_bytes, eliminando i risultati usati meno
+    di recente (LRU); con spill_dir i risultati eliminati dalla memoria
+    vengono salvati su disco come .npy e ricaricati quando servono.
+    Gli array restituiti sono in sola lettura, perché condivisi con la cache.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.npy")
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.spill_dir and os.path.exists(self._spill_path(key)):
+            self.hits += 1
+            array = np.load(self._spill_path(key))
+            self.put(key, array)
+            return self.entries.get(key, array)
+        self.misses += 1
+        return None
+
+    def put(self, key, array):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+        if array.nbytes > self.max_bytes:
+            # Troppo grande per la memoria: al più finisce su disco
+            self._spill(key, array)
+            return
+        array = np.array(array)
+        array.setflags(write=False)
+        self.entries[key] = array
+        self.bytes += array.nbytes
+        while self.bytes > self.max_bytes:
+            old_key, old_array = self.entries.popitem(last=False)
+            self.bytes -= old_array.nbytes
+            self._spill(old_key, old_array)
+
+    def _spill(self, key, array):
+        if self.spill_dir and not os.path.exists(self._spill_path(key)):
+            # Scrittura su file temporaneo e rename: niente .npy a metà
+            tmp_path = self._spill_path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, self._spill_path(key))
+
+    def clear(self, disk=False):
+        self.entries.clear()
+        self.bytes = 0
+        if disk and self.spill_dir:
+            for name in os.listdir(self.spill_dir):
+                if name.endswith(".npy"):
+                    os.remove(os.path.join(self.spill_dir, name))
+
+    def __contains__(self, key):
+        return key in self.entries or bool(self.spill_dir and os.path.exists(self._spill_path(key)))
+
+
+def run_chain_cached(image, filtri, cache, key=None, on_stage=None, compute=None):
+    """
+    Applica la catena [(nome, func, params), ...] riusando dalla cache gli
+    stadi già calcolati: se cambia solo la coda della catena, vengono
+    ricalcolati solo gli stadi modificati e quelli successivi.
+    - key: chiave dell'immagine, se già nota (evita di ricalcolare l'hash)
+    - on_stage(i, nome, params, from_cache, seconds): chiamata dopo ogni stadio
+    - compute(image, func, params): calcola uno stadio non in cache
+      (default: apply_filter_to_channels)
+    """
+    compute = compute or (lambda image, func, params: apply_filter_to_channels(image, func, **params))
+    key = key or image_key(image)
+    for i, (nome, func, params) in enumerate(filtri):
+        # Parametri completi dei default: {} e i default espliciti danno la stessa chiave
+        key = stage_key(key, nome, full_params(func, params))
+        start = time.perf_counter()
+        cached = cache.get(key)
+        with measure("stage", nome, image.size, index=i, params=params, from_cache=cached is not None):
+            if cached is None:
+                image = compute(image, func, params)
+                cache.put(key, image)
+            else:
+                image = cached
+        if on_stage is not None:
+            on_stage(i, nome, params, cached is not None, time.perf_counter() - start)
+    return image
@@ -0,0 +1,97 @@
+class _Voce(dict):
+    """
+    Voce del catalogo {"func": ..., "params": [...]}: la funzione viene
+    cercata in filters.py alla prima lettura di "func".
+    """
+
+    def __init__(self, func_name, params):
+        super().__init__(params=params)
+        self.func_name = func_name
+
+    def __missing__(self, key):
+        if key != "func":
+            raise KeyError(key)
+        import filters
+        self["func"] = getattr(filters, self.func_name)
+        return self["func"]
+
+
+# Catalogo dei filtri condiviso da GUI e riga di comando: nome → funzione e parametri.
+# Le funzioni stanno in filters.py, che (con NumPy) viene importato solo al
+# primo uso di un filtro: l'elenco dei nomi e dei parametri non lo richiede
+FILTRI = {
+    "Filtro di Media": _Voce("mean_filter", ["kernel_size"]),
+    "Filtro Gaussiano": _Voce("gaussian_filter", ["kernel_size", "sigma"]),
+    "Filtro Mediano": _Voce("median_filter", ["kernel_size"]),
+    "Filtro Mediano Adattivo": _Voce("adaptive_median_filter", ["max_kernel_size"]),
+    "Filtro Mediano Selettivo": _Voce("selective_median_filter", ["kernel_size"]),
+    "Filtro Mediano Adattivo Selettivo": _Voce("selective_adaptive_median_filter", ["max_kernel_size"]),
+    "Filtro Bilaterale": _Voce("bilateral_filter", ["kernel_size", "sigma_spatial", "sigma_intensity"]),
+    "Filtro Bilaterale Veloce": _Voce("bilateral_filter", ["kernel_size", "sigma_spatial", "sigma_intensity", "tolerance"]),
+    "Filtro Non-Local Means": _Voce("non_local_means_filter", ["patch_size", "search_size", "h"]),
+    "Filtro Non-Local Means Veloce": _Voce("non_local_means_filter", ["patch_size", "search_size", "h", "search_step"]),
+    "Filtro Minimo": _Voce("min_filter", ["kernel_size"]),
+    "Filtro Massimo": _Voce("max_filter", ["kernel_size"]),
+    "Apertura (Min → Max)": _Voce("opening_filter", ["kernel_size"]),
+    "Chiusura (Max → Min)": _Voce("closing_filter", ["kernel_size"]),
+    "Filtro di Media Piramidale": _Voce("pyramid_mean_filter", ["kernel_size", "levels"]),
+    "Filtro Gaussiano Piramidale": _Voce("pyramid_gaussian_filter", ["kernel_size", "sigma", "levels"]),
+    "Filtro Mediano Piramidale": _Voce("pyramid_median_filter", ["kernel_size", "levels"]),
+}
+
+
+def parse_param(value):
+    """
+    Converte il testo di un parametro: float se contiene un punto, int se è
+    un numero intero, altrimenti resta testo (es. precision=float32).
+    """
+    value = value.strip()
+    try:
+        return float(value) if "." in value else int(value)
+    except ValueError:
+        if value.replace("_", "").isalnum() and not value[:1].isdigit():
+            return value
+        raise
+
+
+def full_params(func, params):
+    """
+    Parametri del filtro completati con i valori di default della funzione.
+    """
+    import inspect  # 20 ms all'avvio: serve solo quando si usa un filtro
+
+    defaults = {
+        name: p.default
+        for name, p in inspect.signature(func).parameters.items()
+        if p.default is not inspect.Parameter.empty
+    }
+    return {**defaults, **params}
+
+
+def build_filtro(nome, params):
+    """
+    Restituisce la tupla (nome, func, params) usata dalle catene di filtri,
+    controllando che il filtro e i suoi parametri esistano nel catalogo.
+    Oltre ai parametri del filtro sono ammesse le opzioni sui canali di
+    apply_filter_to_channels (luminance, channel_params), per i filtri di
+    PRECISION_FILTERS precision e per i filtri piramidali level_params.
+    """
+    if nome not in FILTRI:
+        raise ValueError(f"Filtro sconosciuto: {nome!r}. Disponibili: {', '.join(FILTRI)}")
+    from filters import CHANNEL_OPTIONS, PRECISION_FILTERS
+
+    func = FILTRI[nome]["func"]
+    opzioni = set(CHANNEL_OPTIONS) | ({"precision"} if func in PRECISION_FILTERS else set())
+    if getattr(func, "pyramid_of", None) is not None:
+        opzioni.add("level_params")
+    sconosciuti = set(params) - set(FILTRI[nome]["params"]) - opzioni
+    if sconosciuti:
+        raise ValueError(f"Parametri non validi per {nome}: {', '.join(sorted(sconosciuti))}")
+    testo = [k for k in FILTRI[nome]["params"] if isinstance(params.get(k), str)]
+    if testo:
+        raise ValueError(f"Parametri non numerici per {nome}: {', '.join(testo)}")
+    precision = params.get("precision")
+    if precision is not None and precision not in PRECISION_FILTERS[func]:
+        raise ValueError(f"Precisione non valida per {nome}: {precision!r}. "
+                         f"Disponibili: {', '.join(PRECISION_FILTERS[func])}")
+    return (nome, func, dict(params))
@@ -0,0 +1,224 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from catalog import FILTRI, build_filtro, parse_param
+
+# NumPy, PIL, i filtri e il pool di processi vengono importati nelle funzioni
+# che li usano: --help e gli errori sugli argomenti rispondono subito
+
+
+ESTENSIONI_IMMAGINI = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+# Righe lette al centro dell'immagine per stimare il rumore con --auto --stream
+AUTO_BAND_ROWS = 1024
+
+
+def parse_filtro(spec):
+    """
+    Converte una specifica "Nome filtro:param=valore,param=valore" nella
+    tupla (nome, func, params). I parametri omessi usano i default del filtro.
+    """
+    nome, _, testo_params = spec.partition(":")
+    params = {}
+    for coppia in filter(None, (p.strip() for p in testo_params.split(","))):
+        chiave, uguale, valore = coppia.partition("=")
+        if not uguale:
+            raise ValueError(f"Parametro non valido in {spec!r}: atteso param=valore")
+        params[chiave.strip()] = parse_param(valore)
+    return build_filtro(nome.strip(), params)
+
+
+def find_inputs(sorgenti):
+    """
+    Espande cartelle e pattern glob nella lista ordinata dei file immagine.
+    """
+    percorsi = set()
+    for sorgente in sorgenti:
+        if os.path.isdir(sorgente):
+            candidati = [os.path.join(sorgente, nome) for nome in os.listdir(sorgente)]
+        else:
+            candidati = glob.glob(sorgente, recursive=True)
+        percorsi.update(p for p in candidati if os.path.isfile(p) and p.lower().endswith(ESTENSIONI_IMMAGINI))
+    return sorted(percorsi)
+
+
+def output_path_for(input_path, output_dir, estensione=None):
+    nome, ext = os.path.splitext(os.path.basename(input_path))
+    if estensione and not estensione.startswith("."):
+        estensione = "." + estensione
+    return os.path.join(output_dir, nome + (estensione or ext))
+
+
+def auto_pipeline(source, record):
+    """
+    Pipeline consigliata da noise.recommend_chain per un'immagine (array o
+    lettore a strisce di streamio, di cui si legge solo una banda centrale
+    di righe). La stima e il piano finiscono nel record del log.
+    """
+    import numpy as np
+    from noise import estimate_noise, recommend_chain
+    from pipeline import Pipeline
+
+    campione = source
+    if not isinstance(source, np.ndarray):
+        y0 = max(0, (source.shape[0] - AUTO_BAND_ROWS) // 2)
+        campione = source[y0:y0 + AUTO_BAND_ROWS]
+    stima = estimate_noise(campione)
+    pipeline = Pipeline.from_filtri(recommend_chain(stima, source.shape))
+    record.update(noise=stima, plan=pipeline.describe_plan())
+    return pipeline
+
+
+def process_file(input_path, output_path, pipeline, stream=False):
+    """
+    Filtra un file e restituisce il record per il log della corsa.
+    Eseguita nei processi del pool: gli errori diventano record, non eccezioni.
+    Con stream=True l'immagine viene letta, filtrata e scritta a strisce
+    (streamio.stream_file, stessa catena fusa ma senza statistiche).
+    Con pipeline=None la catena viene scelta per ogni file con auto_pipeline.
+    """
+    from streamio import open_image, stream_file
+    from utils import load_image, save_image, stats
+
+    record = {"input": input_path, "output": output_path}
+    start = time.perf_counter()
+    try:
+        if stream:
+            if pipeline is None:
+                reader = open_image(input_path)
+                pipeline = auto_pipeline(reader, record)
+                if hasattr(reader, "close"):
+                    reader.close()
+            stream_file(input_path, pipeline, output_path)
+            record.update(status="ok", streamed=True)
+            record["seconds"] = round(time.perf_counter() - start, 4)
+            return record
+        image = load_image(input_path)
+        if pipeline is None:
+            pipeline = auto_pipeline(image, record)
+        filtered = pipeline.run(image)
+        save_image(filtered, output_path)
+        record.update(
+            status="ok",
+            shape=list(image.shape),
+            stats_before=[[float(m), float(v)] for m, v in stats(image)],
+            stats_after=[[float(m), float(v)] for m, v in stats(filtered)],
+        )
+    except Exception as exc:  # un file rovinato non deve fermare tutta la corsa
+        record.update(status="error", error=f"{type(exc).__name__}: {exc}")
+    record["seconds"] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def run_batch(inputs, pipeline, output_dir, workers=None, overwrite=False, estensione=None, log_dir=None, stream=False):
+    """
+    Filtra tutti i file di `inputs` con un pool di processi, saltando quelli
+    già presenti in output_dir (a meno di overwrite). Scrive un log JSON Lines
+    per la corsa (un record per file più un riepilogo finale) e ne
+    restituisce il percorso. Con pipeline=None la catena è scelta file per
+    file in base al rumore stimato.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    os.makedirs(output_dir, exist_ok=True)
+    log_dir = log_dir or os.path.join(output_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    avvio = datetime.now()
+    log_path = os.path.join(log_dir, f"run-{avvio.strftime('%Y%m%d-%H%M%S-%f')}.jsonl")
+
+    conteggi = {"ok": 0, "skipped": 0, "error": 0}
+    start = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        def scrivi(record):
+            conteggi[record["status"]] += 1
+            log.write(json.dumps(record, ensure_ascii=False) + "\n")
+            log.flush()
+
+        inizio = {
+            "event": "start",
+            "timestamp": avvio.isoformat(timespec="seconds"),
+            "filters": pipeline.to_dict()["stages"] if pipeline is not None else "auto",
+            "plan": pipeline.describe_plan() if pipeline is not None else "auto",
+            "files": len(inputs),
+            "workers": workers,
+        }
+        log.write(json.dumps(inizio, ensure_ascii=False) + "\n")
+
+        da_fare = []
+        assegnati = set()
+        for input_path in inputs:
+            output_path = output_path_for(input_path, output_dir, estensione)
+            if output_path in assegnati:
+                # Es. foto.jpg e foto.png con --ext png: non sovrascrivere in silenzio
+                scrivi({"input": input_path, "output": output_path, "status": "error",
+                        "error": "file di uscita già assegnato a un altro ingresso"})
+            elif not overwrite and os.path.exists(output_path):
+                scrivi({"input": input_path, "output": output_path, "status": "skipped"})
+            else:
+                da_fare.append((input_path, output_path))
+            assegnati.add(output_path)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(process_file, i, o, pipeline, stream) for i, o in da_fare]
+            for future in as_completed(futures):
+                record = future.result()
+                scrivi(record)
+                print(f"[{record['status']}] {record['input']} ({record['seconds']:.2f} s)", file=sys.stderr)
+
+        riepilogo = {"event": "end", **conteggi, "seconds": round(time.perf_counter() - start, 3)}
+        log.write(json.dumps(riepilogo) + "\n")
+
+    return log_path, conteggi
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Applica una catena di filtri a molte immagini, senza interfaccia grafica.",
+        epilog="Filtri disponibili: " + "; ".join(f"{nome} ({', '.join(v['params'])})" for nome, v in FILTRI.items()),
+    )
+    parser.add_argument("inputs", nargs="+", help="cartelle, file o pattern glob (es. 'scansioni/**/*.png')")
+    parser.add_argument("-o", "--output-dir", required=True, help="cartella di destinazione")
+    parser.add_argument("-f", "--filtro", action="append", default=[],
+                        help='filtro da applicare, ripetibile: "Filtro Mediano:kernel_size=3"')
+    parser.add_argument("--chain", help="pipeline salvata in JSON o YAML (in alternativa a --filtro)")
+    parser.add_argument("--auto", action="store_true",
+                        help="sceglie la catena per ogni immagine in base al rumore stimato (in alternativa a --filtro)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processi in parallelo (default: numero di core)")
+    parser.add_argument("--overwrite", action="store_true", help="rielabora anche i file già presenti in uscita")
+    parser.add_argument("--ext", help="estensione dei file di uscita (default: la stessa dell'ingresso)")
+    parser.add_argument("--stream", action="store_true",
+                        help="legge, filtra e scrive a strisce di righe (per immagini molto grandi)")
+    args = parser.parse_args(argv)
+    from pipeline import Pipeline
+
+    if args.auto and (args.chain or args.filtro):
+        parser.error("--auto non si può usare con --filtro o --chain")
+    try:
+        if args.auto:
+            pipeline = None
+        elif args.chain:
+            pipeline = Pipeline.load(args.chain)
+        else:
+            pipeline = Pipeline.from_filtri(parse_filtro(s) for s in args.filtro)
+    except (ValueError, KeyError, ImportError) as exc:
+        parser.error(str(exc))
+    if pipeline is not None and not len(pipeline):
+        parser.error("specificare almeno un filtro con --filtro, --chain o --auto")
+
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        parser.error("nessuna immagine trovata")
+
+    log_path, conteggi = run_batch(inputs, pipeline, args.output_dir, args.workers, args.overwrite, args.ext,
+                                   stream=args.stream)
+    print(f"Elaborati: {conteggi['ok']}, saltati: {conteggi['skipped']}, errori: {conteggi['error']}. Log: {log_path}")
+    return 1 if conteggi["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
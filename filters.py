@@ -1,38 +1,299 @@
-import numpy as np 
-
-
-def apply_filter_to_channels(image, filter_func, **kwargs):
-    # Applica un filtro canale per canale, utile se l'immagine è RGB
-    if image.ndim == 3:  # RGB
-        channels = []
-        for c in range(3):
-            
-            channel_filtered = filter_func(image[:, :, c], **kwargs)
-            channels.append(channel_filtered)
-        # Ricostruzione dell'immagine finale unendo i canali
-        return np.stack(channels, axis=2)
-    else:
-        # In caso di immagine in scala di grigi
-        return filter_func(image, **kwargs)
+import inspect
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from profiling import measure
+
+
+# Memoria massima (in byte) usata per i dati temporanei di un blocco di righe
+_BLOCK_BYTES = 32 * 1024 * 1024
+
+# Dimensione del kernel da cui media e gaussiano passano ai percorsi veloci
+# (immagine integrale / convoluzione separabile)
+_FAST_KERNEL_SIZE = 7
 
-    
+# Dimensione del kernel da cui i mediani su uint8 usano gli istogrammi
+_HISTOGRAM_KERNEL_SIZE = 7
 
-def mean_filter(image, kernel_size=3):
+
+# Opzioni di apply_filter_to_channels che non sono parametri dei filtri
+CHANNEL_OPTIONS = ("luminance", "channel_params")
+
+# Pesi della luminanza Y di YCbCr (ITU-R BT.601, come in JPEG)
+_LUMA = np.array([0.299, 0.587, 0.114])
+
+# Valori del parametro precision dei filtri che fanno calcoli (vedi
+# PRECISION_FILTERS): tipo in virgola mobile dei calcoli, oppure "fixed" per
+# accumulatori interi. Con precision=None i filtri calcolano in float64 e
+# media, gaussiano e bilaterale troncano il risultato come hanno sempre
+# fatto; con una precisione esplicita il risultato viene arrotondato e
+# limitato all'intervallo del tipo di uscita.
+# Mediani, minimo e massimo restituiscono valori dell'immagine, quindi sono
+# già esatti e non hanno il parametro.
+PRECISIONS = ("float64", "float32", "fixed")
+
+
+def apply_filter_to_channels(image, filter_func, luminance=False, channel_params=None, **kwargs):
     """
-    Applica un filtro di media a un'immagine (array NumPy in scala di grigi).
-    kernel_size: dimensione del filtro 
+    Applica un filtro a un'immagine in scala di grigi o (H, W, C) con
+    qualsiasi numero di canali (RGB, RGBA...).
+    - i filtri di MULTICHANNEL_FILTERS lavorano su tutti i canali in un solo
+      passaggio; le altre funzioni vengono chiamate canale per canale
+    - channel_params: {canale: parametri che sostituiscono kwargs per quel
+      canale, oppure None per lasciarlo invariato}, es. {3: None} per non
+      toccare l'alfa di un'immagine RGBA
+    - luminance: filtra solo la luminanza Y (YCbCr) dei primi tre canali e
+      mantiene la crominanza (un solo canale invece di tre); gli eventuali
+      altri canali restano invariati
+    Ogni chiamata viene misurata se ci sono callback in profiling.
+    """
+    if luminance and channel_params:
+        raise ValueError("luminance e channel_params non si possono usare insieme")
+    if image.ndim == 3 and luminance and image.shape[2] >= 3:
+        return _filter_luminance(image, filter_func, kwargs)
+    if image.ndim == 2 or not channel_params:
+        return _filter_all(image, filter_func, kwargs)
+
+    # Canali con gli stessi parametri filtrati insieme; None = canale invariato
+    groups = []
+    for c in range(image.shape[2]):
+        override = channel_params.get(c, channel_params.get(str(c), {}))
+        if override is None:
+            continue
+        params = {**kwargs, **override}
+        for group_params, channels in groups:
+            if group_params == params:
+                channels.append(c)
+                break
+        else:
+            groups.append((params, [c]))
+
+    results = [(channels, _filter_all(image[:, :, channels], filter_func, params)) for params, channels in groups]
+    dtype = np.result_type(*(result for _, result in results)) if results else image.dtype
+    filtered_image = image.astype(dtype)
+    for channels, result in results:
+        filtered_image[:, :, channels] = result
+    return filtered_image
+
+
+def _filter_all(image, filter_func, params):
+    name = filter_func.__name__
+    if image.ndim == 2 or filter_func in MULTICHANNEL_FILTERS:
+        with measure("channel", name, image.size, channel=None, channels=_channels(image), params=params):
+            return filter_func(image, **params)
+
+    filtered_image = None
+    for c in range(image.shape[2]):
+        with measure("channel", name, image.shape[0] * image.shape[1], channel=c, params=params):
+            channel_filtered = filter_func(image[:, :, c], **params)
+        if filtered_image is None:
+            filtered_image = np.empty(image.shape, dtype=channel_filtered.dtype)
+        filtered_image[:, :, c] = channel_filtered
+    return filtered_image
+
+
+def _filter_luminance(image, filter_func, params):
+    """
+    Filtra la luminanza e aggiunge a R, G e B la sua variazione: nella
+    conversione inversa da YCbCr Y ha peso 1 su tutti e tre i canali, quindi
+    la crominanza resta quella originale (e un filtro che non cambia Y
+    restituisce esattamente l'immagine).
+    """
+    rgb = image[:, :, :3].astype(np.float64)
+    y = rgb @ _LUMA
+    if np.issubdtype(image.dtype, np.integer):
+        info = np.iinfo(image.dtype)
+        y = np.clip(np.rint(y), info.min, info.max)
+    y_in = y.astype(image.dtype)
+    y_out = _filter_all(y_in, filter_func, params)
+
+    rgb += (y_out.astype(np.float64) - y_in)[:, :, np.newaxis]
+    filtered_image = image.astype(y_out.dtype)
+    if np.issubdtype(y_out.dtype, np.integer):
+        info = np.iinfo(y_out.dtype)
+        rgb = np.clip(np.rint(rgb), info.min, info.max)
+    filtered_image[:, :, :3] = rgb
+    return filtered_image
+
+
+def quantize(values, dtype):
+    """
+    Riporta un risultato al tipo `dtype`: per i tipi interi arrotonda e limita
+    all'intervallo del tipo invece di troncare.
+    """
+    dtype = np.dtype(dtype)
+    if values.dtype == dtype:
+        return values
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return np.clip(np.rint(values), info.min, info.max).astype(dtype)
+    return values.astype(dtype)
+
+
+# Margine sotto l'intero successivo entro cui un valore conta come quell'intero
+# prima del troncamento: gli errori di arrotondamento delle somme pesate sono
+# molto più piccoli, ma bastano a far perdere un livello a una zona piatta
+_TRUNCATE_EPS = 1e-6
+
+
+def _before_truncation(values, dtype):
+    # Il troncamento resta, ma 199.9999999 diventa 200 come nel calcolo esatto
+    return values + _TRUNCATE_EPS if np.issubdtype(dtype, np.integer) else values
+
+
+def _check_precision(precision, image, fixed=True):
+    if precision is not None and precision not in PRECISIONS:
+        raise ValueError(f"Precisione sconosciuta: {precision!r}. Disponibili: {', '.join(PRECISIONS)}")
+    if precision == "fixed" and (not fixed or image.dtype not in (np.uint8, np.uint16)):
+        raise ValueError("precision='fixed' vale solo per media e gaussiano su immagini uint8 o uint16")
+
+
+def _pad(image, rows, cols=None):
+    """
+    Padding 'edge' solo su righe e colonne (non sui canali di un'immagine (H, W, C)).
+    rows e cols sono un intero o una coppia (prima, dopo); cols di default = rows.
+    """
+    cols = rows if cols is None else cols
+    widths = [(p, p) if np.isscalar(p) else tuple(p) for p in (rows, cols)]
+    return np.pad(image, widths + [(0, 0)] * (image.ndim - 2), mode='edge')
+
+
+def _channels(image):
+    # Numero di canali (1 per le immagini 2D)
+    return int(np.prod(image.shape[2:], dtype=np.intp))
+
+
+def _per_channel(func, image, *args):
+    """
+    Applica func(canale 2D, *args) a ogni canale, per gli algoritmi che
+    lavorano su un canale alla volta; il risultato ha la forma dell'immagine.
     """
-    padded_image = np.pad(image, pad_width=kernel_size//2, mode='edge')
+    if image.ndim == 2:
+        return func(image, *args)
+    filtered_image = None
+    for c in range(image.shape[2]):
+        channel = func(image[:, :, c], *args)
+        if filtered_image is None:
+            filtered_image = np.empty(image.shape, dtype=channel.dtype)
+        filtered_image[:, :, c] = channel
+    return filtered_image
+
+
+def _row_blocks(height, width, window_elems, itemsize=8):
+    """
+    Divide le righe dell'immagine in blocchi (start, stop) in modo che i dati
+    temporanei di un blocco (width * window_elems valori per riga) restino
+    sotto _BLOCK_BYTES.
+    """
+    row_bytes = max(1, width * window_elems * itemsize)
+    rows = max(1, _BLOCK_BYTES // row_bytes)
+    for start in range(0, height, rows):
+        yield start, min(start + rows, height)
+
+
+def _sliding_windows(padded_image, kernel_size, height, width):
+    """
+    Restituisce una vista (height, width[, C], kernel_size, kernel_size) senza copie:
+    l'elemento [i, j] è la finestra padded_image[i:i+kernel_size, j:j+kernel_size]
+    (di ogni canale, per le immagini (H, W, C)).
+    """
+    windows = sliding_window_view(padded_image, (kernel_size, kernel_size), axis=(0, 1))
+    return windows[:height, :width]
+
+
+def _flatten_windows(windows):
+    """
+    Copia un blocco di finestre (r, w[, C], k, k) in un array contiguo (r, w[, C], k*k),
+    così le riduzioni sull'ultimo asse seguono lo stesso ordine di somma
+    usato da NumPy su una singola finestra.
+    """
+    return np.ascontiguousarray(windows).reshape(windows.shape[:-2] + (-1,))
+
+
+def _apply_windowed(image, kernel_size, pad_size, block_func, itemsize=8):
+    """
+    Motore comune dei filtri a finestra scorrevole.
+    - block_func: riceve le finestre di un blocco di righe (r, w[, C], k, k) e
+      restituisce i valori filtrati (r, w[, C])
+    Il risultato viene scritto in un array np.zeros_like(image), quindi il
+    tipo di uscita (e il troncamento) è lo stesso dei filtri pixel per pixel.
+    Le immagini (H, W, C) vengono filtrate in un solo passaggio su tutti i canali.
+    """
+    padded_image = _pad(image, pad_size)
     filtered_image = np.zeros_like(image)
 
-    height, width = image.shape
+    height, width = image.shape[:2]
+    windows = _sliding_windows(padded_image, kernel_size, height, width)
 
-    for i in range(height):
-        for j in range(width):
-           
-            window = padded_image[i:i+kernel_size, j:j+kernel_size]
-            
-            filtered_image[i, j] = np.mean(window)
+    for start, stop in _row_blocks(height, width * _channels(image), kernel_size * kernel_size, itemsize):
+        filtered_image[start:stop] = block_func(windows[start:stop])
+
+    return filtered_image
+
+
+
+def _box_sum(padded_image, kernel_size, start, stop, width):
+    """
+    Somma su finestre kernel_size x kernel_size delle righe [start, stop)
+    calcolata con un'immagine integrale: O(1) per pixel qualunque sia il kernel.
+    Per immagini intere la somma è esatta (vedi _box_dtype).
+    """
+    acc_dtype = _box_dtype(padded_image.dtype, kernel_size)
+    slab = padded_image[start:stop + kernel_size - 1]
+    integral = np.zeros((slab.shape[0] + 1, slab.shape[1] + 1) + slab.shape[2:], dtype=acc_dtype)
+    np.cumsum(np.cumsum(slab, axis=0, dtype=acc_dtype), axis=1, out=integral[1:, 1:])
+
+    rows = stop - start
+    k = kernel_size
+    return (integral[k:k + rows, k:k + width] - integral[:rows, k:k + width]
+            - integral[k:k + rows, :width] + integral[:rows, :width])
+
+
+def _box_dtype(dtype, kernel_size):
+    """
+    Accumulatore dell'immagine integrale. Per gli interi senza segno basta
+    uint32 finché la somma di una finestra (più mezzo divisore, per
+    l'arrotondamento) sta in 32 bit: l'integrale può traboccare, ma le
+    differenze modulo 2**32 danno comunque la somma esatta della finestra,
+    con metà della memoria di int64.
+    """
+    if np.issubdtype(dtype, np.unsignedinteger):
+        n = kernel_size * kernel_size
+        return np.uint32 if (int(np.iinfo(dtype).max) + 1) * n < 2**32 else np.uint64
+    return np.int64 if np.issubdtype(dtype, np.integer) else np.float64
+
+
+def mean_filter(image, kernel_size=3, precision=None):
+    """
+    Applica un filtro di media a un'immagine (array NumPy in scala di grigi).
+    kernel_size: dimensione del filtro
+    precision: vedi PRECISIONS; con "fixed" la divisione è intera e arrotondata
+    Da _FAST_KERNEL_SIZE in su (o con una precisione esplicita) usa
+    l'immagine integrale (costo indipendente dal kernel).
+    """
+    _check_precision(precision, image)
+    if kernel_size < _FAST_KERNEL_SIZE and precision is None:
+        def block_mean(windows):
+            return np.mean(_flatten_windows(windows), axis=-1)
+
+        return _apply_windowed(image, kernel_size, kernel_size // 2, block_mean)
+
+    padded_image = _pad(image, kernel_size // 2)
+    filtered_image = np.zeros_like(image)
+    height, width = image.shape[:2]
+    n = kernel_size * kernel_size
+    itemsize = np.dtype(_box_dtype(image.dtype, kernel_size)).itemsize
+
+    # Due righe dell'accumulatore (cumsum + immagine integrale) per ogni riga del blocco
+    for start, stop in _row_blocks(height, (width + kernel_size) * _channels(image), 2, itemsize):
+        sums = _box_sum(padded_image, kernel_size, start, stop, width)
+        if precision is None:
+            filtered_image[start:stop] = sums / n
+        elif precision == "fixed":
+            filtered_image[start:stop] = (sums + n // 2) // n
+        else:
+            filtered_image[start:stop] = quantize(sums.astype(precision) / np.dtype(precision).type(n), image.dtype)
 
     return filtered_image
 
@@ -47,162 +308,1162 @@ def gaussian_kernel(size, sigma=1):
     kernel = np.exp(-(xx**2 + yy**2) / (2. * sigma**2))
     return kernel / np.sum(kernel)
 
-def gaussian_filter(image, kernel_size=3, sigma=1):
+def gaussian_kernel_1d(size, sigma=1):
+    """
+    Crea il kernel gaussiano 1D normalizzato: gaussian_kernel(size, sigma)
+    è (a meno di arrotondamenti) il prodotto esterno di due kernel 1D.
+    """
+    ax = np.arange(-size // 2 + 1., size // 2 + 1.)
+    kernel = np.exp(-(ax**2) / (2. * sigma**2))
+    return kernel / np.sum(kernel)
+
+
+def separable_filter(image, row_kernel, col_kernel=None, center=None, dtype=np.float64):
+    """
+    Convoluzione separabile: prima lungo le righe (row_kernel), poi lungo le
+    colonne (col_kernel, di default uguale a row_kernel), con padding 'edge'
+    come i filtri a finestra.
+    - center: indice del peso che cade sul pixel filtrato (default len // 2,
+      come kernel_size // 2 nei filtri a finestra), oppure una coppia (cy, cx)
+      per col_kernel e row_kernel
+    - dtype: tipo dei calcoli e del risultato (float32 dimezza la memoria)
+    Restituisce un array `dtype` con la stessa forma dell'immagine (2D o (H, W, C)).
+    """
+    if col_kernel is None:
+        col_kernel = row_kernel
+    row_kernel = np.asarray(row_kernel, dtype=dtype)
+    col_kernel = np.asarray(col_kernel, dtype=dtype)
+    if center is None:
+        col_center, row_center = len(col_kernel) // 2, len(row_kernel) // 2
+    elif np.isscalar(center):
+        col_center = row_center = center
+    else:
+        col_center, row_center = center
+
+    padded_image = _pad(image, (col_center, len(col_kernel) - 1 - col_center),
+                        (row_center, len(row_kernel) - 1 - row_center))
+    height, width = image.shape[:2]
+    result = np.empty(image.shape, dtype=dtype)
+
+    for start, stop in _row_blocks(height, width * _channels(image), 2, np.dtype(dtype).itemsize):
+        slab = padded_image[start:stop + len(col_kernel) - 1]
+
+        # Passata orizzontale: una moltiplicazione-somma per ogni peso del kernel
+        horizontal = np.zeros((slab.shape[0], width) + slab.shape[2:], dtype=dtype)
+        for t, weight in enumerate(row_kernel):
+            horizontal += weight * slab[:, t:t + width]
+
+        # Passata verticale sul risultato intermedio
+        rows = stop - start
+        block = result[start:stop]
+        block[:] = 0
+        for t, weight in enumerate(col_kernel):
+            block += weight * horizontal[t:t + rows]
+
+    return result
+
+
+def _fft_size(n):
+    """
+    Il più piccolo intero >= n senza fattori primi oltre il 5: le FFT di
+    NumPy (pocketfft) sono molto più veloci su queste lunghezze.
+    """
+    best = 1 << max(0, n - 1).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            size = p35
+            while size < n:
+                size *= 2
+            best = min(best, size)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def _fft_plan(height, width, kh, kw, channels):
+    """
+    Righe per blocco e dimensioni (fh, fw) delle FFT della convoluzione a
+    blocchi: ogni blocco di righe (con kh - 1 righe di sovrapposizione)
+    è trasformato per intero in larghezza. I blocchi sono alti almeno
+    4 volte il kernel, così la sovrapposizione costa poco, e restano sotto
+    _BLOCK_BYTES finché è possibile.
+    """
+    fw = _fft_size(width + kw - 1)
+    row_bytes = (fw // 2 + 1) * 16 * 2 * channels  # trasformata e prodotto complessi
+    rows = max(4 * kh, _BLOCK_BYTES // row_bytes) - kh + 1
+    fh = _fft_size(min(height, max(1, rows)) + kh - 1)
+    return fh - kh + 1, fh, fw
+
+
+def _fft_correlate(image, kernel, center, dtype):
+    """
+    Convoluzione con la FFT (overlap-save su blocchi di righe): costo per
+    pixel proporzionale a log(dimensione della FFT), indipendente dal kernel.
+    Il kernel viene capovolto, così il risultato è lo stesso dei percorsi
+    diretto e separabile.
+    """
+    kh, kw = kernel.shape
+    cy, cx = center
+    padded_image = _pad(image, (cy, kh - 1 - cy), (cx, kw - 1 - cx))
+    height, width = image.shape[:2]
+    rows, fh, fw = _fft_plan(height, width, kh, kw, _channels(image))
+
+    spectrum = np.fft.rfft2(kernel[::-1, ::-1], s=(fh, fw))
+    spectrum = spectrum.reshape(spectrum.shape + (1,) * (image.ndim - 2))
+    result = np.empty(image.shape, dtype=dtype)
+
+    for start in range(0, height, rows):
+        stop = min(start + rows, height)
+        slab = padded_image[start:stop + kh - 1]
+        block = np.fft.irfft2(np.fft.rfft2(slab, s=(fh, fw), axes=(0, 1)) * spectrum, s=(fh, fw), axes=(0, 1))
+        result[start:stop] = block[kh - 1:kh - 1 + stop - start, kw - 1:kw - 1 + width]
+
+    return result
+
+
+def _direct_correlate(image, kernel, center, dtype):
+    """
+    Convoluzione diretta: una moltiplicazione-somma vettoriale per ogni peso
+    del kernel 2D, su blocchi di righe.
+    """
+    kh, kw = kernel.shape
+    cy, cx = center
+    padded_image = _pad(image, (cy, kh - 1 - cy), (cx, kw - 1 - cx))
+    height, width = image.shape[:2]
+    result = np.empty(image.shape, dtype=dtype)
+    kernel = kernel.astype(dtype)
+
+    for start, stop in _row_blocks(height, width * _channels(image), 2, np.dtype(dtype).itemsize):
+        block = result[start:stop]
+        block[:] = 0
+        for dy in range(kh):
+            for dx in range(kw):
+                if kernel[dy, dx]:
+                    block += kernel[dy, dx] * padded_image[start + dy:stop + dy, dx:dx + width]
+
+    return result
+
+
+def _separable_factors(kernel):
+    """
+    Se il kernel 2D è il prodotto esterno di due vettori (rango 1, come
+    gaussiano e media) restituisce (colonne, righe), altrimenti None.
+    """
+    u, s, vt = np.linalg.svd(kernel)
+    if s[0] == 0 or (len(s) > 1 and s[1] > 1e-10 * s[0]):
+        return None
+    scale = np.sqrt(s[0])
+    return u[:, 0] * scale, vt[0] * scale
+
+
+# Costi stimati (in nanosecondi per pixel) usati da plan_convolution: una
+# moltiplicazione-somma vettoriale per peso, e per la FFT il costo di
+# trasformata, prodotto e antitrasformata per elemento e per log2 della
+# dimensione. Misurati su immagini uint8 con NumPy 2 e pocketfft.
+_TAP_COST = 1.8
+_FFT_COST = 2.8
+
+
+def plan_convolution(shape, kernel):
+    """
+    Sceglie come eseguire convolve(image, kernel) su un'immagine di forma
+    `shape`: "direct" (k_h * k_w operazioni per pixel), "separable"
+    (k_h + k_w, solo per kernel 1D o 2D di rango 1) o "fft" (costo che cresce
+    con il logaritmo della dimensione della FFT, non con il kernel).
+    """
+    kernel = np.asarray(kernel)
+    kh, kw = (len(kernel), len(kernel)) if kernel.ndim == 1 else kernel.shape
+    height, width = shape[:2]
+    channels = int(np.prod(shape[2:], dtype=np.intp))
+
+    costs = {"direct": _TAP_COST * kh * kw}
+    if kernel.ndim == 1 or _separable_factors(kernel) is not None:
+        costs["separable"] = _TAP_COST * (kh + kw)
+    rows, fh, fw = _fft_plan(height, width, kh, kw, channels)
+    # Elementi trasformati per pixel di uscita, per log2 della dimensione
+    costs["fft"] = _FFT_COST * (fh * fw) / (rows * width) * np.log2(fh * fw)
+    return min(costs, key=costs.get)
+
+
+def convolve(image, kernel, center=None, method="auto", dtype=np.float64):
+    """
+    Applica un kernel lineare qualsiasi (es. nitidezza, laplaciano del
+    gaussiano) con padding 'edge', come i filtri a finestra: il peso
+    kernel[i, j] va sul pixel (y - cy + i, x - cx + j).
+    - kernel: array 2D, oppure 1D da applicare su righe e colonne (kernel
+      separabile, equivalente al prodotto esterno con se stesso)
+    - center: (cy, cx) del peso che cade sul pixel filtrato (default la metà
+      delle dimensioni, come kernel_size // 2); per un kernel 1D basta un intero
+    - method: "auto" (plan_convolution), "direct", "separable" o "fft"
+    - dtype: tipo dei calcoli del percorso diretto e separabile
+    Restituisce un array `dtype` con la forma dell'immagine (2D o (H, W, C)),
+    senza arrotondare né limitare: per tornare al tipo dell'immagine si usa
+    quantize.
+    """
+    kernel = np.asarray(kernel, dtype=np.float64)
+    if kernel.ndim == 1:
+        c = len(kernel) // 2 if center is None else center
+        factors, center, kernel2d = (kernel, kernel), (c, c), None
+    elif kernel.ndim == 2:
+        center = (kernel.shape[0] // 2, kernel.shape[1] // 2) if center is None else tuple(center)
+        factors, kernel2d = None, kernel
+    else:
+        raise ValueError("Il kernel deve essere 1D o 2D")
+
+    if method == "auto":
+        method = plan_convolution(image.shape, kernel)
+    if method == "separable":
+        if factors is None:
+            factors = _separable_factors(kernel2d)
+        if factors is None:
+            raise ValueError("Il kernel non è separabile (rango maggiore di 1)")
+        col_kernel, row_kernel = factors
+        return separable_filter(image, row_kernel, col_kernel, center, dtype)
+    if kernel2d is None:
+        kernel2d = np.outer(*factors)
+    if method == "direct":
+        return _direct_correlate(image, kernel2d, center, dtype)
+    if method == "fft":
+        return _fft_correlate(image, kernel2d, center, dtype)
+    raise ValueError(f"Metodo sconosciuto: {method!r}. Disponibili: auto, direct, separable, fft")
+
+
+def _fixed_kernel(kernel, bits):
+    """
+    Pesi interi che sommano esattamente 2**bits; l'errore di arrotondamento
+    va sul peso centrale, così il kernel resta simmetrico.
+    """
+    scale = 1 << bits
+    weights = np.rint(np.asarray(kernel) * scale).astype(np.int64)
+    weights[len(weights) // 2] += scale - weights.sum()
+    return weights
+
+
+def _separable_fixed(image, kernel):
+    """
+    Convoluzione separabile in virgola fissa per immagini uint8 e uint16:
+    pesi interi a 24 bit (uint8) o 23 bit (uint16), passata orizzontale in un
+    accumulatore uint32 (uint8) o uint64 (uint16) e verticale in uno uint64,
+    poi divisione arrotondata con uno shift. Nessun calcolo in virgola mobile
+    e nessun overflow; l'errore dei pesi è al più kernel_size / 2**16 livelli
+    (uint8) o kernel_size / 2**7 (uint16), quindi il risultato differisce da
+    quello in float64 arrotondato al più di un livello (per uint16 fino a
+    kernel di 64 elementi).
+    """
+    bits, narrow = (24, np.uint32) if image.dtype == np.uint8 else (23, np.uint64)
+    wide = np.uint64
+    weights = _fixed_kernel(kernel, bits)
+    row_weights, col_weights = weights.astype(narrow), weights.astype(wide)
+    shift = 2 * bits
+    center = len(weights) // 2
+
+    padded_image = _pad(image, (center, len(weights) - 1 - center))
+    height, width = image.shape[:2]
+    filtered_image = np.empty_like(image)
+
+    for start, stop in _row_blocks(height, width * _channels(image), 2, np.dtype(wide).itemsize):
+        slab = padded_image[start:stop + len(weights) - 1]
+        horizontal = np.zeros((slab.shape[0], width) + slab.shape[2:], dtype=narrow)
+        for t, weight in enumerate(row_weights):
+            horizontal += weight * slab[:, t:t + width]
+
+        rows = stop - start
+        block = np.full((rows, width) + slab.shape[2:], 1 << (shift - 1), dtype=wide)
+        for t, weight in enumerate(col_weights):
+            block += weight * horizontal[t:t + rows]
+        filtered_image[start:stop] = block >> shift
+
+    return filtered_image
+
+
+def gaussian_filter(image, kernel_size=3, sigma=1, precision=None):
     """
     Applica un filtro gaussiano a un'immagine.
-    - image: array 2D grayscale
-    - kernel_size: dimensione del filtro 
+    - image: array 2D grayscale o (H, W, C)
+    - kernel_size: dimensione del filtro
     - sigma: deviazione standard della gaussiana
+    - precision: vedi PRECISIONS; con una precisione esplicita usa sempre
+      convolve nel tipo richiesto ("fixed": separabile con pesi interi)
+    Da _FAST_KERNEL_SIZE in su usa la convoluzione separabile (2k operazioni
+    per pixel invece di k²), mai la FFT, i cui errori di arrotondamento sono
+    troppo grandi per un risultato troncato (la FFT resta per le precisioni
+    esplicite, che arrotondano). Un'immagine costante resta costante.
     """
+    _check_precision(precision, image)
+    if precision == "fixed":
+        return _separable_fixed(image, gaussian_kernel_1d(kernel_size, sigma))
+    if precision is not None:
+        return quantize(convolve(image, gaussian_kernel_1d(kernel_size, sigma), dtype=precision), image.dtype)
+
+    if kernel_size >= _FAST_KERNEL_SIZE:
+        kernel_1d = gaussian_kernel_1d(kernel_size, sigma)
+        filtered_image = np.zeros_like(image)
+        filtered_image[:] = _before_truncation(convolve(image, kernel_1d, method="separable"), image.dtype)
+        return filtered_image
+
     kernel = gaussian_kernel(kernel_size, sigma)
-    pad_size = kernel_size // 2
-    padded_image = np.pad(image, pad_size, mode='edge')
-    filtered_image = np.zeros_like(image)
 
+    def block_gaussian(windows):
+        products = windows * kernel
+        return _before_truncation(np.sum(products.reshape(products.shape[:-2] + (-1,)), axis=-1), image.dtype)
+
+    return _apply_windowed(image, kernel_size, kernel_size // 2, block_gaussian)
+
+
+
+def _sliding_sum(values, size):
+    """
+    Somme di `size` righe consecutive di `values`: out[j] = values[j:j+size].sum(0).
+    Usa somme di 2, 4, 8... righe (raddoppi), quindi O(log size) passate vettoriali.
+    """
+    n_out = len(values) - size + 1
+    result = None
+    offset = 0
+    power = values
+    width = 1
+    while True:
+        if size & width:
+            part = power[offset:offset + n_out]
+            if result is None:
+                result = part.copy()
+            else:
+                result += part
+            offset += width
+        if width * 2 > size:
+            return result
+        power = power[:-width] + power[width:]
+        width *= 2
+
+
+def _count_dtype(kernel_size):
+    # I conteggi di una finestra non superano kernel_size²
+    return np.uint16 if kernel_size * kernel_size < 2**16 else np.uint32
+
+
+def _column_histograms(padded_image, rows, count_dtype):
+    """
+    Istogrammi di colonna delle prime `rows` righe: uno fine (256 valori) e
+    uno grossolano (16 gruppi da 16 valori) per ogni colonna.
+    """
+    padded_width = padded_image.shape[1]
+    fine = np.zeros((padded_width, 256), dtype=count_dtype)
+    coarse = np.zeros((padded_width, 16), dtype=count_dtype)
+    for r in range(rows):
+        _add_row(fine, coarse, padded_image[r])
+    return fine, coarse
+
+
+def _add_row(fine, coarse, values):
+    columns = np.arange(len(values))
+    fine[columns, values] += 1
+    coarse[columns, values >> 4] += 1
+
+
+def _remove_row(fine, coarse, values):
+    columns = np.arange(len(values))
+    fine[columns, values] -= 1
+    coarse[columns, values >> 4] -= 1
+
+
+def _window_histograms(fine, coarse, size, cols=None):
+    """
+    Istogrammi delle finestre larghe `size` colonne a partire da ogni colonna
+    (o solo da quelle in `cols`), sommando gli istogrammi di colonna.
+    """
+    if cols is None:
+        return _sliding_sum(fine, size), _sliding_sum(coarse, size)
+
+    window_fine = fine[cols]
+    window_coarse = coarse[cols]
+    for t in range(1, size):
+        window_fine += fine[cols + t]
+        window_coarse += coarse[cols + t]
+    return window_fine, window_coarse
+
+
+def _histogram_rank(fine, coarse, rank):
+    """
+    Valore di rango `rank` (0 = minimo) per ogni riga degli istogrammi:
+    prima si trova il gruppo di 16 valori sull'istogramma grossolano, poi il
+    valore esatto scorrendo solo quei 16 conteggi fini.
+    """
+    rows = np.arange(len(fine))
+    coarse_cumulative = np.cumsum(coarse, axis=1, dtype=coarse.dtype)
+    group = np.argmax(coarse_cumulative > rank, axis=1)
+    below = coarse_cumulative[rows, group] - coarse[rows, group]
+
+    group_counts = fine.reshape(len(fine), 16, 16)[rows, group]
+    fine_cumulative = np.cumsum(group_counts, axis=1, dtype=fine.dtype) + below[:, np.newaxis]
+    return group * 16 + np.argmax(fine_cumulative > rank, axis=1)
+
+
+def _histogram_median(image, kernel_size):
+    """
+    Mediano a istogrammi (stile Perreault–Hébert) per immagini uint8.
+    Gli istogrammi di colonna scendono di una riga alla volta aggiornando due
+    conteggi per colonna; quelli delle finestre sono somme di istogrammi di
+    colonna. Il costo per pixel praticamente non dipende da kernel_size.
+    """
+    pad = kernel_size // 2
+    padded_image = np.pad(image, pad, mode='edge')
+    filtered_image = np.zeros_like(image)
     height, width = image.shape
+    n = kernel_size * kernel_size
 
+    fine, coarse = _column_histograms(padded_image, kernel_size, _count_dtype(kernel_size))
     for i in range(height):
-        for j in range(width):
-            region = padded_image[i:i+kernel_size, j:j+kernel_size]
-            filtered_pixel = np.sum(region * kernel)
-            filtered_image[i, j] = filtered_pixel
+        if i > 0:
+            _remove_row(fine, coarse, padded_image[i - 1])
+            _add_row(fine, coarse, padded_image[i + kernel_size - 1])
 
-    return filtered_image
+        window_fine, window_coarse = _window_histograms(fine, coarse, kernel_size)
+        window_fine, window_coarse = window_fine[:width], window_coarse[:width]
+        if n % 2:
+            filtered_image[i] = _histogram_rank(window_fine, window_coarse, n // 2)
+        else:
+            # Come np.median: media dei due valori centrali
+            low = _histogram_rank(window_fine, window_coarse, n // 2 - 1)
+            high = _histogram_rank(window_fine, window_coarse, n // 2)
+            filtered_image[i] = (low + high) / 2
 
+    return filtered_image
 
 
 def median_filter(image, kernel_size=3):
     """
     Applica un filtro mediano a un'immagine .
-    kernel_size: dimensione del filtro 
+    kernel_size: dimensione del filtro
     sostituisce ogni pixel con la mediana dei pixel attorno,
+    Per immagini uint8 da _HISTOGRAM_KERNEL_SIZE in su usa gli istogrammi (costo costante).
+    """
+    if image.dtype == np.uint8 and kernel_size >= _HISTOGRAM_KERNEL_SIZE:
+        return _per_channel(_histogram_median, image, kernel_size)
+
+    def block_median(windows):
+        return np.median(_flatten_windows(windows), axis=-1)
+
+    return _apply_windowed(image, kernel_size, kernel_size // 2, block_median)
+
+
+
+def _adaptive_level(filtered, pending, z_min, z_max, z_med, z_xy):
+    """
+    Un passo del mediano adattivo su array di pixel ancora da decidere.
+    Scrive in `filtered` i pixel decisi a questo livello e li toglie da `pending`.
+    """
+    A1 = z_med - z_min
+    A2 = z_med - z_max
+    level_ok = pending & (A1 > 0) & (A2 < 0)
+
+    # Le differenze sono calcolate nel tipo dell'immagine, come per i
+    # singoli pixel della versione originale
+    with np.errstate(over='ignore'):
+        B1 = z_xy - z_min
+        B2 = z_xy - z_max
+    not_noisy = (B1 > 0) & (B2 < 0)
+
+    filtered[level_ok] = np.where(not_noisy, z_xy, z_med)[level_ok]  # pixel rumoroso → mediano
+    pending &= ~level_ok
+
+
+def _adaptive_median_sorted(image, sizes, max_pad):
+    """
+    Mediano adattivo con np.median sulle finestre (qualsiasi tipo di immagine).
     """
-    pad_size = kernel_size // 2
-    padded_image = np.pad(image, pad_size, mode='edge')
+    padded_image = _pad(image, max_pad)
     filtered_image = np.zeros_like(image)
+    height, width = image.shape[:2]
+    max_size = sizes[-1]
 
-    height, width = image.shape
+    for start, stop in _row_blocks(height, width * _channels(image), max_size * max_size):
+        rows = stop - start
+        block = padded_image[start:stop + 2 * max_pad]
+        out = filtered_image[start:stop]
+        pending = np.ones(out.shape, dtype=bool)
 
-    for i in range(height):
-        for j in range(width):
-            region = padded_image[i:i+kernel_size, j:j+kernel_size]
-            median_value = np.median(region)
-            filtered_image[i, j] = median_value
+        for current_size in sizes:
+            pad = current_size // 2
+            # Come nella versione pixel per pixel, la finestra parte da [i, j]
+            # dell'immagine con il padding massimo
+            windows = _flatten_windows(_sliding_windows(block, current_size, rows, width))
+            z_med = np.median(windows, axis=-1)
+            _adaptive_level(out, pending, np.min(windows, axis=-1), np.max(windows, axis=-1),
+                            z_med, block[pad:pad + rows, pad:pad + width])
+            if not pending.any():
+                break
+
+        out[pending] = z_med[pending]  #  usa il mediano finale
 
     return filtered_image
 
 
+def _grow_window_histograms(fine, coarse, padded_image, i, cols, size):
+    """
+    Allarga le finestre (ancorate in [i, cols]) da size a size + 2 aggiungendo
+    agli istogrammi solo il bordo nuovo: due righe sotto e due colonne a destra.
+    """
+    new_size = size + 2
+    # Bordo: righe size, size+1 su tutte le new_size colonne + colonne size, size+1 sulle prime size righe
+    row_offsets = np.concatenate([np.repeat([size, size + 1], new_size), np.tile(np.arange(size), 2)])
+    col_offsets = np.concatenate([np.tile(np.arange(new_size), 2), np.repeat([size, size + 1], size)])
+    values = padded_image[i + row_offsets, cols[:, np.newaxis] + col_offsets].astype(np.intp)
+
+    owner = np.arange(len(cols))[:, np.newaxis]
+    fine += np.bincount((owner * 256 + values).ravel(), minlength=len(cols) * 256).reshape(len(cols), 256).astype(fine.dtype)
+    coarse += np.bincount((owner * 16 + (values >> 4)).ravel(), minlength=len(cols) * 16).reshape(len(cols), 16).astype(coarse.dtype)
 
-def adaptive_median_filter(image, max_kernel_size=7):
+
+def _adaptive_median_histogram(image, sizes, max_pad):
     """
-    Applica un filtro mediano adattivo.
-    - max_kernel_size: dimensione massima della finestra 
+    Mediano adattivo a istogrammi per immagini uint8.
+    Gli istogrammi 3x3 di tutta la riga vengono dagli istogrammi di colonna
+    (come in _histogram_median); per i pixel ancora da decidere lo stesso
+    istogramma viene allargato al passo successivo aggiungendo solo il bordo.
+    Minimo, massimo e mediano si leggono dallo stesso istogramma.
     """
-    padded_image = np.pad(image, max_kernel_size // 2, mode='edge')
+    padded_image = np.pad(image, max_pad, mode='edge')
     filtered_image = np.zeros_like(image)
     height, width = image.shape
+    first_size = sizes[0]
 
+    fine, coarse = _column_histograms(padded_image, first_size, _count_dtype(sizes[-1]))
     for i in range(height):
-        for j in range(width):
-            current_size = 3
-            pixel_filtered = False
-
-            while current_size <= max_kernel_size and not pixel_filtered:
-                pad = current_size // 2
-                region = padded_image[i:i+current_size, j:j+current_size]
-                z_min = np.min(region)
-                z_max = np.max(region)
-                z_med = np.median(region)
-                z_xy = padded_image[i + pad, j + pad]
-
-                A1 = z_med - z_min
-                A2 = z_med - z_max
-
-                if A1 > 0 and A2 < 0:
-                    B1 = z_xy - z_min
-                    B2 = z_xy - z_max
-                    if B1 > 0 and B2 < 0:
-                        filtered_image[i, j] = z_xy  # pixel non rumoroso
-                    else:
-                        filtered_image[i, j] = z_med  # pixel rumoroso → sostituito
-                    pixel_filtered = True
-                else:
-                    current_size += 2  # aumenta dimensione finestra
-
-            if not pixel_filtered:
-                filtered_image[i, j] = z_med  #  usa il mediano finale
+        if i > 0:
+            _remove_row(fine, coarse, padded_image[i - 1])
+            _add_row(fine, coarse, padded_image[i + first_size - 1])
+
+        window_fine, window_coarse = _window_histograms(fine, coarse, first_size)
+        window_fine, window_coarse = window_fine[:width], window_coarse[:width]
+
+        out = filtered_image[i]
+        cols = np.arange(width)
+        for current_size in sizes:
+            if current_size > first_size:
+                _grow_window_histograms(window_fine, window_coarse, padded_image, i, cols, current_size - 2)
+
+            pad = current_size // 2
+            n = current_size * current_size
+            z_min = _histogram_rank(window_fine, window_coarse, 0).astype(image.dtype)
+            z_max = _histogram_rank(window_fine, window_coarse, n - 1).astype(image.dtype)
+            z_med = _histogram_rank(window_fine, window_coarse, n // 2)
+            z_xy = padded_image[i + pad, cols + pad]
+
+            level_out = out[cols]
+            pending = np.ones(len(cols), dtype=bool)
+            _adaptive_level(level_out, pending, z_min, z_max, z_med, z_xy)
+            out[cols] = level_out
+
+            cols = cols[pending]
+            z_med = z_med[pending]
+            window_fine, window_coarse = window_fine[pending], window_coarse[pending]
+            if not len(cols):
+                break
+
+        out[cols] = z_med  #  usa il mediano finale
 
     return filtered_image
 
 
+def adaptive_median_filter(image, max_kernel_size=7):
+    """
+    Applica un filtro mediano adattivo.
+    - max_kernel_size: dimensione massima della finestra
+    Per immagini uint8 da _HISTOGRAM_KERNEL_SIZE in su usa gli istogrammi.
+    """
+    sizes = list(range(3, max_kernel_size + 1, 2))
+    if not sizes:
+        raise ValueError("max_kernel_size deve essere almeno 3")
+
+    max_pad = max_kernel_size // 2
+    if image.dtype == np.uint8 and max_kernel_size >= _HISTOGRAM_KERNEL_SIZE:
+        return _per_channel(_adaptive_median_histogram, image, sizes, max_pad)
+    return _adaptive_median_sorted(image, sizes, max_pad)
+
+
 
+# Distanza minima (su 8 bit) dalla mediana dei vicini per considerare
+# impulsivo un pixel estremo
+IMPULSE_JUMP = 50
 
-def bilateral_filter(image, kernel_size=5, sigma_spatial=2.0, sigma_intensity=30.0):
+# Offset dei vicini 3x3 (escluso il centro)
+_NEIGHBOR_DY, _NEIGHBOR_DX = np.delete(np.mgrid[-1:2, -1:2].reshape(2, 9), 4, axis=1)
+
+
+def value_range(image):
     """
-    - kernel_size: dimensione della finestra
-    - sigma_spatial: influenza della distanza 
-    - sigma_intensity: influenza della differenza di intensità 
+    Valori estremi (min, max) di un'immagine: quelli del tipo per gli interi
+    (0 e 255 per uint8), quelli presenti nell'immagine per i float.
+    """
+    if np.issubdtype(image.dtype, np.integer):
+        info = np.iinfo(image.dtype)
+        return info.min, info.max
+    return image.min(), image.max()
+
+
+def impulse_outliers(center, neighbors, low, high, jump):
+    """
+    Test sale e pepe vettoriale: center (n,) e i suoi vicini (n, m).
+    Un pixel è impulsivo se vale low o high e dista più di `jump` dalla
+    mediana dei vicini non estremi; se tutti i vicini sono estremi, se almeno
+    uno ha un valore diverso (rumore fitto), non in un'area satura.
+    """
+    extreme = (neighbors == low) | (neighbors == high)
+    n_clean = np.count_nonzero(~extreme, axis=1)
+    # Mediana dei soli vicini non estremi: gli estremi vanno in fondo all'ordinamento
+    ordered = np.sort(np.where(extreme, np.inf, neighbors.astype(np.float64)), axis=1)
+    lo = np.maximum(n_clean - 1, 0) // 2
+    hi = n_clean // 2
+    with np.errstate(invalid='ignore'):
+        median = (np.take_along_axis(ordered, lo[:, np.newaxis], axis=1)[:, 0]
+                  + np.take_along_axis(ordered, np.minimum(hi, neighbors.shape[1] - 1)[:, np.newaxis], axis=1)[:, 0]) / 2
+        far = np.abs(center - median) > jump
+
+    candidate = (center == low) | (center == high)
+    crowded = (neighbors != center[:, np.newaxis]).any(axis=1)
+    return candidate & np.where(n_clean > 0, far, crowded)
+
+
+def _gather(padded_image, coords, dy, dx):
+    # Valori padded_image[y + dy, x + dx] (e canale) per ogni coordinata: array (n, len(dy))
+    index = (coords[0][:, np.newaxis] + dy, coords[1][:, np.newaxis] + dx)
+    return padded_image[index + tuple(c[:, np.newaxis] for c in coords[2:])]
+
+
+def _coordinate_chunks(coords, window_elems):
+    # Blocchi di coordinate con dati temporanei sotto _BLOCK_BYTES
+    step = max(1, _BLOCK_BYTES // (8 * window_elems))
+    for start in range(0, len(coords[0]), step):
+        yield tuple(c[start:start + step] for c in coords)
+
+
+def detect_impulses(image, threshold=IMPULSE_JUMP):
+    """
+    Maschera booleana (con la forma dell'immagine, canale per canale) dei
+    pixel sale e pepe: solo i pixel estremi (vedi value_range) vengono
+    confrontati con i vicini 3x3 (impulse_outliers), quindi il costo dipende
+    dal numero di pixel estremi, non dall'area.
+    - threshold: distanza minima dalla mediana dei vicini, in livelli su 8 bit
+      (scalata per gli altri tipi)
+    Per i float gli estremi sono min e max dell'immagine, quindi a tasselli
+    la maschera può cambiare.
+    """
+    low, high = value_range(image)
+    jump = threshold * (float(high) - float(low)) / 255
+    mask = (image == low) | (image == high)
+    padded_image = _pad(image, 1)
+    for coords in _coordinate_chunks(np.nonzero(mask), 9):
+        center = image[coords]
+        neighbors = _gather(padded_image, coords, _NEIGHBOR_DY + 1, _NEIGHBOR_DX + 1)
+        mask[coords] = impulse_outliers(center, neighbors, low, high, jump)
+    return mask
+
+
+def selective_median_filter(image, kernel_size=3, threshold=IMPULSE_JUMP):
+    """
+    Mediano solo sui pixel trovati da detect_impulses: sui pixel rovinati il
+    risultato è quello di median_filter, gli altri restano esattamente
+    invariati. Il costo cresce con la densità del rumore, non con l'area.
     """
+    mask = detect_impulses(image, threshold)
+    filtered_image = image.copy()
     pad = kernel_size // 2
-    padded_image = np.pad(image, pad, mode='edge')
-    filtered_image = np.zeros_like(image, dtype=np.float64)
+    padded_image = _pad(image, pad)
+    dy, dx = np.mgrid[:kernel_size, :kernel_size].reshape(2, -1)
+    for coords in _coordinate_chunks(np.nonzero(mask), kernel_size * kernel_size):
+        filtered_image[coords] = np.median(_gather(padded_image, coords, dy, dx), axis=1)
+    return filtered_image
 
-    # Pre-calcola i pesi spaziali (dipendono solo dalla posizione)
-    spatial_weights = np.zeros((kernel_size, kernel_size))
-    for i in range(kernel_size):
-        for j in range(kernel_size):
-            dx = i - pad
-            dy = j - pad
-            spatial_weights[i, j] = np.exp(-(dx**2 + dy**2) / (2 * sigma_spatial**2))
 
-    height, width = image.shape
+def selective_adaptive_median_filter(image, max_kernel_size=7, threshold=IMPULSE_JUMP):
+    """
+    Mediano adattivo solo sui pixel trovati da detect_impulses: sui pixel
+    rovinati il risultato è quello di adaptive_median_filter (stesse
+    finestre e stessi livelli), gli altri restano esattamente invariati.
+    """
+    sizes = list(range(3, max_kernel_size + 1, 2))
+    if not sizes:
+        raise ValueError("max_kernel_size deve essere almeno 3")
 
-    for i in range(height):
-        for j in range(width):
-            region = padded_image[i:i+kernel_size, j:j+kernel_size]
-            intensity_diff = region - image[i, j]
-            radiometric_weights = np.exp(-(intensity_diff**2) / (2 * sigma_intensity**2))
-            total_weights = spatial_weights * radiometric_weights
-            weight_sum = np.sum(total_weights)
-            pixel_value = np.sum(region * total_weights) / weight_sum
-            filtered_image[i, j] = pixel_value
+    mask = detect_impulses(image, threshold)
+    filtered_image = image.copy()
+    padded_image = _pad(image, max_kernel_size // 2)
+    for coords in _coordinate_chunks(np.nonzero(mask), sizes[-1] * sizes[-1]):
+        out = np.zeros(len(coords[0]), dtype=image.dtype)
+        pending = np.ones(len(out), dtype=bool)
+        for current_size in sizes:
+            # Finestre ancorate in [y, x] dell'immagine con il padding massimo,
+            # come in _adaptive_median_sorted
+            dy, dx = np.mgrid[:current_size, :current_size].reshape(2, -1)
+            windows = _gather(padded_image, coords, dy, dx)
+            pad = current_size // 2
+            z_xy = _gather(padded_image, coords, np.array([pad]), np.array([pad]))[:, 0]
+            z_med = np.median(windows, axis=1)
+            _adaptive_level(out, pending, windows.min(axis=1), windows.max(axis=1), z_med, z_xy)
+            if not pending.any():
+                break
+        out[pending] = z_med[pending]
+        filtered_image[coords] = out
+    return filtered_image
 
-    return np.clip(filtered_image, 0, 255).astype(np.uint8)
 
 
 
-def min_filter(image, kernel_size=3):
+def _spatial_kernel_1d(kernel_size, sigma_spatial):
     """
-    Filtro Minimo: sostituisce ogni pixel con il valore minimo nella finestra.
-     per rimuovere rumore impulsivo chiaro.
+    Pesi spaziali 1D del filtro bilaterale: il kernel 2D è il loro prodotto esterno.
+    """
+    offsets = np.arange(kernel_size) - kernel_size // 2
+    return np.exp(-(offsets**2) / (2 * sigma_spatial**2))
+
+
+def _range_lut(sigma_intensity, dtype=np.float64):
+    """
+    Tabella dei pesi di intensità per tutte le differenze possibili tra due
+    pixel uint8 (0..255): evita di calcolare np.exp per ogni finestra.
+    """
+    diff = np.arange(256, dtype=np.float64)
+    return np.exp(-(diff**2) / (2 * sigma_intensity**2)).astype(dtype)
+
+
+def _range_weights(values, center, sigma_intensity, lut=None):
+    """
+    Pesi di intensità tra `values` e `center` (nel tipo di `center` se non
+    c'è la LUT). Con la LUT la differenza è calcolata in int16, quindi senza
+    overflow sui uint8.
+    """
+    if lut is not None:
+        return lut[np.abs(values.astype(np.int16) - center)]
+    diff = values.astype(center.dtype) - center
+    return np.exp(-(diff**2) / center.dtype.type(2 * sigma_intensity**2))
+
+
+def _bilateral_exact(image, kernel_size, sigma_spatial, sigma_intensity, dtype=np.float64):
+    """
+    Bilaterale esatto: un passo vettoriale per ogni posizione del kernel,
+    su blocchi di righe interi, con pesi e somme nel tipo `dtype`.
     """
     pad = kernel_size // 2
-    padded_image = np.pad(image, pad, mode='edge')
-    filtered_image = np.zeros_like(image)
+    padded_image = _pad(image, pad)
+    height, width = image.shape[:2]
+    filtered_image = np.zeros(image.shape, dtype=dtype)
 
-    height, width = image.shape
+    spatial_1d = _spatial_kernel_1d(kernel_size, sigma_spatial)
+    spatial_weights = np.outer(spatial_1d, spatial_1d).astype(dtype)
+    lut = _range_lut(sigma_intensity, dtype) if image.dtype == np.uint8 else None
 
-    for i in range(height):
-        for j in range(width):
-            region = padded_image[i:i+kernel_size, j:j+kernel_size]
-            filtered_image[i, j] = np.min(region)
+    for start, stop in _row_blocks(height, width * _channels(image), 6, np.dtype(dtype).itemsize):
+        center = image[start:stop].astype(np.int16 if lut is not None else dtype)
+        numerator = np.zeros(center.shape, dtype=dtype)
+        weight_sum = np.zeros(center.shape, dtype=dtype)
+
+        for dy in range(kernel_size):
+            for dx in range(kernel_size):
+                region = padded_image[start + dy:stop + dy, dx:dx + width]
+                weights = spatial_weights[dy, dx] * _range_weights(region, center, sigma_intensity, lut)
+                numerator += weights * region
+                weight_sum += weights
+
+        filtered_image[start:stop] = numerator / weight_sum
+
+    return filtered_image
+
+
+def _convolve_axis(values, kernel, axis):
+    """
+    Convoluzione 1D lungo `axis` con kernel centrato (lunghezza dispari) e
+    zeri fuori dai bordi.
+    """
+    radius = len(kernel) // 2
+    values = np.moveaxis(values, axis, 0)
+    padded = np.concatenate([np.zeros((radius,) + values.shape[1:]), values,
+                             np.zeros((radius,) + values.shape[1:])])
+    result = np.zeros(values.shape, dtype=np.float64)
+    for t, weight in enumerate(kernel):
+        result += weight * padded[t:t + len(values)]
+    return np.moveaxis(result, 0, axis)
+
+
+def _bilateral_grid(image, kernel_size, sigma_spatial, sigma_intensity, tolerance):
+    """
+    Bilaterale approssimato con la griglia bilaterale (Paris–Durand / Chen).
+    I pixel vengono accumulati in una griglia 3D (riga, colonna, intensità)
+    con celle di tolerance * sigma_spatial pixel e tolerance * sigma_intensity
+    livelli; la griglia viene sfumata con una gaussiana separabile 3D e il
+    risultato si legge per interpolazione trilineare. Il costo per pixel non
+    dipende da kernel_size.
+    """
+    values = image.astype(np.float64)
+    height, width = values.shape
+    cell = max(1.0, tolerance * sigma_spatial)
+    level = tolerance * sigma_intensity
+    low = values.min()
+
+    # Coordinate continue di ogni pixel nella griglia
+    gy = np.arange(height) / cell
+    gx = np.arange(width) / cell
+    gz = (values - low) / level
+    shape = (int(gy[-1]) + 2, int(gx[-1]) + 2, int(gz.max()) + 2)
+
+    # Accumulo (splat) sulla cella più vicina
+    iy = np.rint(gy).astype(np.intp)[:, np.newaxis]
+    ix = np.rint(gx).astype(np.intp)[np.newaxis, :]
+    iz = np.rint(gz).astype(np.intp)
+    flat = ((iy * shape[1] + ix) * shape[2] + iz).ravel()
+    size = shape[0] * shape[1] * shape[2]
+    numerator = np.bincount(flat, weights=values.ravel(), minlength=size).reshape(shape)
+    weight_sum = np.bincount(flat, minlength=size).astype(np.float64).reshape(shape)
+
+    # Sfumatura: gaussiane in unità di cella, la spaziale limitata alla finestra
+    spatial_radius = max(1, int(np.ceil((kernel_size // 2) / cell)))
+    offsets = np.arange(-spatial_radius, spatial_radius + 1) * cell
+    spatial_kernel = np.exp(-(offsets**2) / (2 * sigma_spatial**2))
+    range_radius = int(np.ceil(3 / tolerance))
+    offsets = np.arange(-range_radius, range_radius + 1) * level
+    range_kernel = np.exp(-(offsets**2) / (2 * sigma_intensity**2))
+    for axis, kernel in ((0, spatial_kernel), (1, spatial_kernel), (2, range_kernel)):
+        numerator = _convolve_axis(numerator, kernel, axis)
+        weight_sum = _convolve_axis(weight_sum, kernel, axis)
+
+    # Lettura (slice) con interpolazione trilineare
+    y0 = np.minimum(gy.astype(np.intp), shape[0] - 2)[:, np.newaxis]
+    x0 = np.minimum(gx.astype(np.intp), shape[1] - 2)[np.newaxis, :]
+    z0 = np.minimum(gz.astype(np.intp), shape[2] - 2)
+    fy = gy[:, np.newaxis] - y0
+    fx = gx[np.newaxis, :] - x0
+    fz = gz - z0
+
+    filtered_num = np.zeros(values.shape, dtype=np.float64)
+    filtered_den = np.zeros(values.shape, dtype=np.float64)
+    for dy in (0, 1):
+        wy = fy if dy else 1 - fy
+        for dx in (0, 1):
+            wx = fx if dx else 1 - fx
+            for dz in (0, 1):
+                w = wy * wx * (fz if dz else 1 - fz)
+                filtered_num += w * numerator[y0 + dy, x0 + dx, z0 + dz]
+                filtered_den += w * weight_sum[y0 + dy, x0 + dx, z0 + dz]
+
+    return np.divide(filtered_num, filtered_den, out=values.copy(), where=filtered_den > 0)
+
+
+def bilateral_filter(image, kernel_size=5, sigma_spatial=2.0, sigma_intensity=30.0, tolerance=None, precision=None):
+    """
+    - kernel_size: dimensione della finestra
+    - sigma_spatial: influenza della distanza
+    - sigma_intensity: influenza della differenza di intensità
+    - tolerance: None per il calcolo esatto; altrimenti usa la griglia bilaterale
+      con celle di tolerance * sigma_spatial pixel e tolerance * sigma_intensity
+      livelli di intensità (più piccolo = più preciso e più lento)
+    - precision: "float64" o "float32" (vedi PRECISIONS) per il calcolo esatto;
+      la griglia calcola sempre in float64 e arrotonda il risultato
+    Il risultato è sempre uint8.
+    """
+    _check_precision(precision, image, fixed=False)
+    if tolerance is None:
+        filtered_image = _bilateral_exact(image, kernel_size, sigma_spatial, sigma_intensity, precision or np.float64)
+    else:
+        # La griglia (e il suo intervallo di intensità) è di un canale alla volta
+        filtered_image = _per_channel(_bilateral_grid, image, kernel_size, sigma_spatial, sigma_intensity, tolerance)
+
+    # La griglia arrotonda sempre: troncando, le zone piatte perderebbero un livello
+    if precision is not None or tolerance is not None:
+        return quantize(filtered_image, np.uint8)
+    return np.clip(filtered_image, 0, 255).astype(np.uint8)
+
+
+
+def _search_offsets(search_size, search_step):
+    """
+    Spostamenti (dy, dx) della finestra di ricerca, escluso (0, 0); con
+    search_step > 1 solo uno ogni search_step per asse (modalità veloce).
+    """
+    radius = search_size // 2
+    steps = [d for d in range(-radius, radius + 1) if d % search_step == 0]
+    return [(dy, dx) for dy in steps for dx in steps if dy or dx]
+
+
+def non_local_means_filter(image, patch_size=5, search_size=11, h=10.0, search_step=1, precision=None):
+    """
+    Filtro non-local means (Buades, Coll, Morel): ogni pixel diventa la media
+    dei pixel della finestra di ricerca, pesati con exp(-d / h²), dove d è la
+    distanza quadratica media tra le patch attorno ai due pixel.
+    - patch_size: lato delle patch confrontate
+    - search_size: lato della finestra di ricerca
+    - h: forza del filtro (circa la deviazione standard del rumore)
+    - search_step: 1 per la ricerca completa; con valori maggiori si prova
+      solo uno spostamento ogni search_step per asse (circa search_step² volte
+      più veloce)
+    - precision: "float64" (default) o "float32" per pesi e somme
+    Per ogni spostamento le distanze di tutte le patch si ottengono con
+    un'immagine integrale delle differenze al quadrato, quindi il costo non
+    dipende da patch_size. Sulle immagini (H, W, C) la distanza è calcolata
+    su tutti i canali insieme e i pesi sono comuni. Il pixel centrale ha il
+    peso massimo tra quelli dei vicini. Il risultato è arrotondato al tipo
+    dell'immagine.
+    """
+    _check_precision(precision, image, fixed=False)
+    dtype = np.dtype(precision or np.float64)
+    patch_pad, search_pad = patch_size // 2, search_size // 2
+    pad = patch_pad + search_pad
+    height, width = image.shape[:2]
+    channels = _channels(image)
+    # Canali sul primo asse (C, H, W): la somma sui canali e i pesi comuni
+    # lavorano su piani contigui
+    padded_image = np.ascontiguousarray(np.moveaxis(_pad(image, pad).astype(dtype).reshape(
+        (height + 2 * pad, width + 2 * pad, channels)), 2, 0))
+    filtered_image = np.empty(image.shape, dtype=image.dtype)
+    offsets = _search_offsets(search_size, search_step)
+    scale = -1.0 / (h * h * patch_size * patch_size * channels)
+
+    for start, stop in _row_blocks(height, (width + 2 * pad) * channels, 8, dtype.itemsize):
+        rows = stop - start
+        # Patch attorno ai pixel del blocco e pixel del blocco stessi
+        patches = padded_image[:, start + search_pad:stop + search_pad + 2 * patch_pad,
+                               search_pad:search_pad + width + 2 * patch_pad]
+        center = padded_image[:, start + pad:stop + pad, pad:pad + width]
+        numerator = np.zeros(center.shape, dtype=dtype)
+        weight_sum = np.zeros((rows, width), dtype=dtype)
+        weight_max = np.zeros((rows, width), dtype=dtype)
+
+        for dy, dx in offsets:
+            shifted = padded_image[:, start + search_pad + dy:stop + search_pad + 2 * patch_pad + dy,
+                                   search_pad + dx:search_pad + dx + width + 2 * patch_pad]
+            diff = np.square(patches - shifted).sum(axis=0)
+            weights = np.exp(scale * _box_sum(diff, patch_size, 0, rows, width)).astype(dtype, copy=False)
+            np.maximum(weight_max, weights, out=weight_max)
+            weight_sum += weights
+            numerator += weights * shifted[:, patch_pad:patch_pad + rows, patch_pad:patch_pad + width]
+
+        # Senza vicini (search_size 1) il pixel centrale resta com'è
+        weight_max[weight_max == 0] = 1
+        weight_sum += weight_max
+        numerator += weight_max * center
+        result = quantize(numerator / weight_sum, image.dtype)
+        filtered_image[start:stop] = np.moveaxis(result, 0, 2).reshape(filtered_image[start:stop].shape)
 
     return filtered_image
 
+
+
+def _running_extreme(values, size, axis, func):
+    """
+    Minimo/massimo scorrevole 1D di van Herk / Gil–Werman lungo `axis`.
+    - func: np.minimum o np.maximum
+    La sequenza viene divisa in blocchi lunghi `size`: per ogni blocco si
+    calcolano l'estremo progressivo da sinistra (g) e da destra (h), e la
+    finestra [x, x+size) vale func(h[x], g[x+size-1]). Circa 3 confronti per
+    elemento, qualunque sia size. Restituisce len - size + 1 valori lungo axis.
+    """
+    values = np.moveaxis(values, axis, 0)
+    n = values.shape[0]
+    n_out = n - size + 1
+    n_blocks = -(-n // size)
+
+    # Gli elementi aggiunti in fondo non finiscono mai in una finestra valida
+    tail = n_blocks * size - n
+    if tail:
+        values = np.concatenate([values, np.repeat(values[-1:], tail, axis=0)])
+    blocks = values.reshape((n_blocks, size) + values.shape[1:])
+
+    forward = func.accumulate(blocks, axis=1).reshape(values.shape)
+    backward = func.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(values.shape)
+
+    result = func(backward[:n_out], forward[size - 1:size - 1 + n_out])
+    return np.moveaxis(result, 0, axis)
+
+
+def _separable_extreme(image, kernel_size, func):
+    """
+    Minimo/massimo su finestre kernel_size x kernel_size come due passate 1D
+    (righe poi colonne) sul padding 'edge', come gli altri filtri.
+    """
+    padded_image = np.pad(image, kernel_size // 2, mode='edge')
+    filtered_image = np.zeros_like(image)
+    height, width = image.shape
+
+    rows = _running_extreme(padded_image, kernel_size, 1, func)
+    filtered_image[:] = _running_extreme(rows, kernel_size, 0, func)[:height, :width]
+    return filtered_image
+
+
+def min_filter(image, kernel_size=3):
+    """
+    Filtro Minimo: sostituisce ogni pixel con il valore minimo nella finestra.
+     per rimuovere rumore impulsivo chiaro.
+    Usa il minimo scorrevole separabile di van Herk / Gil–Werman.
+    """
+    return _per_channel(_separable_extreme, image, kernel_size, np.minimum)
+
 def max_filter(image, kernel_size=3):
     """
     Filtro Massimo: sostituisce ogni pixel con il valore massimo nella finestra.
      per rimuovere rumore impulsivo scuro.
+    Usa il massimo scorrevole separabile di van Herk / Gil–Werman.
     """
-    pad = kernel_size // 2
-    padded_image = np.pad(image, pad, mode='edge')
-    filtered_image = np.zeros_like(image)
+    return _per_channel(_separable_extreme, image, kernel_size, np.maximum)
 
-    height, width = image.shape
 
-    for i in range(height):
-        for j in range(width):
-            region = padded_image[i:i+kernel_size, j:j+kernel_size]
-            filtered_image[i, j] = np.max(region)
 
-    return filtered_image
+def opening_filter(image, kernel_size=3):
+    """
+    Apertura morfologica: filtro minimo seguito da filtro massimo (erosione → dilatazione).
+    Rimuove le macchioline chiare più piccole della finestra senza scurire il resto.
+    """
+    return max_filter(min_filter(image, kernel_size), kernel_size)
+
+def closing_filter(image, kernel_size=3):
+    """
+    Chiusura morfologica: filtro massimo seguito da filtro minimo (dilatazione → erosione).
+    Rimuove le macchioline scure più piccole della finestra.
+    """
+    return min_filter(max_filter(image, kernel_size), kernel_size)
+
+
+
+# Kernel binomiale 5x5 (separabile) della piramide di Burt e Adelson
+_PYRAMID_KERNEL = np.array([1, 4, 6, 4, 1]) / 16
+
+
+def pyramid_reduce(image):
+    """
+    Livello successivo della piramide gaussiana: sfocatura binomiale 5x5 e
+    un pixel ogni due (righe e colonne), in float64.
+    """
+    # Il kernel si calcola solo sui pixel tenuti, un asse alla volta
+    image = np.asarray(image, dtype=np.float64)
+    for axis in (0, 1):
+        padded = np.moveaxis(_pad_axis(image, axis, 2), axis, 0)
+        size = -(-image.shape[axis] // 2)
+        reduced = sum(w * padded[i:i + 2 * size:2] for i, w in enumerate(_PYRAMID_KERNEL))
+        image = np.moveaxis(reduced, 0, axis)
+    return image
+
+
+def pyramid_expand(image, shape):
+    """
+    Riporta un livello della piramide alla forma (H, W) `shape` del livello
+    precedente: inserimento di zeri e kernel binomiale x2, calcolato per
+    righe pari e dispari separatamente (padding 'edge' come i filtri).
+    """
+    for axis, size in enumerate(shape[:2]):
+        padded = np.moveaxis(_pad_axis(image, axis), axis, 0)
+        n = padded.shape[0] - 2
+        expanded = np.empty((2 * n,) + padded.shape[1:])
+        expanded[0::2] = (padded[:-2] + 6 * padded[1:-1] + padded[2:]) / 8
+        expanded[1::2] = (padded[1:-1] + padded[2:]) / 2
+        image = np.moveaxis(expanded[:size], 0, axis)
+    return image
+
+
+def _pad_axis(image, axis, pad=1):
+    pad_width = [(0, 0)] * image.ndim
+    pad_width[axis] = (pad, pad)
+    return np.pad(image, pad_width, mode='edge')
+
+
+def pyramid_filter(image, filter_func, levels=3, level_params=None, **params):
+    """
+    Esegue filter_func su una piramide laplaciana: l'immagine viene scomposta
+    in `levels` bande di dettaglio (livelli 0..levels-1, dal più fine) e in un
+    residuo a 1/2**levels della risoluzione (livello `levels`); ogni livello
+    viene filtrato con `params` e poi l'immagine viene ricostruita.
+    Sul residuo una finestra kernel_size copre kernel_size * 2**levels pixel
+    dell'originale, al costo di un'immagine 4**levels volte più piccola.
+    - level_params: {livello: parametri che sostituiscono params per quel
+      livello, oppure None per lasciarlo invariato}, es. {0: None} per non
+      toccare i dettagli più fini
+    I livelli sono in float64 e le bande di dettaglio hanno valori negativi:
+    filter_func deve accettarli (media, gaussiano, mediani, minimo, massimo).
+    Il risultato ha il tipo dell'immagine (arrotondato).
+    """
+    level_params = level_params or {}
+    gaussian = [np.asarray(image, dtype=np.float64)]
+    for _ in range(levels):
+        gaussian.append(pyramid_reduce(gaussian[-1]))
+
+    def filtered(level, band):
+        override = level_params.get(level, level_params.get(str(level), {}))
+        if override is None:
+            return band
+        return _filter_all(band, filter_func, {**params, **override})
+
+    result = filtered(levels, gaussian[levels])
+    for level in reversed(range(levels)):
+        shape = gaussian[level].shape
+        detail = gaussian[level] - pyramid_expand(gaussian[level + 1], shape)
+        result = pyramid_expand(result, shape) + filtered(level, detail)
+    return quantize(result, image.dtype)
+
+
+def pyramid(filter_func, levels=3):
+    """
+    Versione piramidale di un filtro qualsiasi (vedi pyramid_filter), con i
+    parametri del filtro più levels e level_params:
+
+        pyramid_median_filter = pyramid(median_filter)
+        pyramid_median_filter(image, kernel_size=5, levels=2)
+
+    La funzione restituita ha l'attributo pyramid_of (il filtro di base),
+    usato per il bordo dei tasselli.
+    """
+    signature = inspect.signature(filter_func)
+
+    def wrapper(image, *args, levels=levels, level_params=None, **params):
+        # Gli argomenti posizionali vanno ai parametri del filtro, come nella firma
+        if args:
+            bound = signature.bind_partial(image, *args).arguments
+            bound.pop(next(iter(signature.parameters)))
+            duplicati = bound.keys() & params.keys()
+            if duplicati:
+                raise TypeError(f"{wrapper.__name__}() got multiple values for argument {sorted(duplicati)[0]!r}")
+            params = {**bound, **params}
+        return pyramid_filter(image, filter_func, levels, level_params, **params)
+
+    wrapper.__signature__ = signature.replace(parameters=list(signature.parameters.values()) + [
+        inspect.Parameter("levels", inspect.Parameter.KEYWORD_ONLY, default=levels),
+        inspect.Parameter("level_params", inspect.Parameter.KEYWORD_ONLY, default=None),
+    ])
+    # Stesso nome della variabile di modulo: la funzione si può passare ai processi
+    wrapper.__name__ = wrapper.__qualname__ = f"pyramid_{filter_func.__name__}"
+    wrapper.__doc__ = f"{filter_func.__name__} su piramide laplaciana (vedi pyramid_filter)."
+    wrapper.pyramid_of = filter_func
+    return wrapper
+
+
+pyramid_mean_filter = pyramid(mean_filter)
+pyramid_gaussian_filter = pyramid(gaussian_filter)
+pyramid_median_filter = pyramid(median_filter)
+
+
+# Precisioni ammesse da ogni filtro con il parametro precision
+PRECISION_FILTERS = {
+    mean_filter: PRECISIONS,
+    gaussian_filter: PRECISIONS,
+    bilateral_filter: ("float64", "float32"),
+    non_local_means_filter: ("float64", "float32"),
+}
+
+# Filtri in cui i canali si influenzano (pesi comuni a tutti i canali):
+# il risultato cambia se i canali vengono filtrati separatamente
+COUPLED_CHANNEL_FILTERS = {non_local_means_filter}
+
+# Filtri che accettano direttamente immagini (H, W, C)
+MULTICHANNEL_FILTERS = {
+    mean_filter,
+    gaussian_filter,
+    median_filter,
+    adaptive_median_filter,
+    selective_median_filter,
+    selective_adaptive_median_filter,
+    bilateral_filter,
+    non_local_means_filter,
+    min_filter,
+    max_filter,
+    opening_filter,
+    closing_filter,
+    pyramid_mean_filter,
+    pyramid_gaussian_filter,
+    pyramid_median_filter,
+}
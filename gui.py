@@ -1,52 +1,53 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk
 import os
-import numpy as np
 from datetime import datetime
 import time
-from utils import load_image, save_image
+import queue
+import threading
+from catalog import FILTRI, parse_param
+from profiling import Profiler
 
-
-
-from filters import (
-    mean_filter,
-    gaussian_filter,
-    median_filter,
-    adaptive_median_filter,
-    bilateral_filter,
-    apply_filter_to_channels,
-    min_filter,
-    max_filter,
-)
-
-FILTRI = {
-    "Filtro di Media": {"func": mean_filter, "params": ["kernel_size"]},
-    "Filtro Gaussiano": {"func": gaussian_filter, "params": ["kernel_size", "sigma"]},
-    "Filtro Mediano": {"func": median_filter, "params": ["kernel_size"]},
-    "Filtro Mediano Adattivo": {"func": adaptive_median_filter, "params": ["max_kernel_size"]},
-    "Filtro Bilaterale": {"func": bilateral_filter, "params": ["kernel_size", "sigma_spatial", "sigma_intensity"]},
-    "Filtro Minimo": {"func": min_filter, "params": ["kernel_size"]},
-    "Filtro Massimo": {"func": max_filter, "params": ["kernel_size"]},
-}
+# NumPy, PIL e i filtri vengono importati nelle funzioni che li usano: la
+# finestra si apre subito e importare gui.py resta leggero
 
 
 selected_image = None
+selected_image_key = None
 output_folder = None
 img_preview_before = None
 img_preview_after = None
 filtro_frames = []
+# Cache dei risultati intermedi delle catene (modificando solo gli ultimi
+# filtri, quelli precedenti non vengono ricalcolati) e cache separata per
+# l'anteprima, calcolata in un altro thread. Create al primo uso da get_cache
+_caches = {}
+CACHE_BYTES = {"risultati": 512 * 1024 * 1024, "anteprima": 64 * 1024 * 1024}
+
+# Anteprima: immagine ridotta (o ritaglio) con la sua chiave e la sua scala
+anteprima = {"proxy": None, "key": None, "scale": 1.0, "timer": None, "thread": None, "coda": None, "di_nuovo": False}
+# Attesa dopo l'ultima modifica prima di ricalcolare l'anteprima (ms)
+PREVIEW_DELAY = 300
+
+
+def get_cache(nome):
+    if nome not in _caches:
+        from cache import ResultCache
+        _caches[nome] = ResultCache(max_bytes=CACHE_BYTES[nome])
+    return _caches[nome]
+
 
 class FiltroFrame(tk.Frame):
-    def __init__(self, master, remove_callback, move_up_callback, move_down_callback):
+    def __init__(self, master, remove_callback, move_up_callback, move_down_callback, change_callback=None):
         super().__init__(master)
+        self.change_callback = change_callback
         self.remove_callback = remove_callback
         self.move_up_callback = move_up_callback
         self.move_down_callback = move_down_callback
 
         self.filtro_var = tk.StringVar()
         self.filtro_var.set(list(FILTRI.keys())[0])
-        self.filtro_menu = tk.OptionMenu(self, self.filtro_var, *FILTRI.keys(), command=self.update_parametri)
+        self.filtro_menu = tk.OptionMenu(self, self.filtro_var, *FILTRI.keys(), command=self.cambia_filtro)
         self.filtro_menu.pack(side="left", padx=5, pady=5)
 
         self.parametri_frame = tk.Frame(self)
@@ -54,6 +55,12 @@ class FiltroFrame(tk.Frame):
         self.parametri_entries = {}
         self.update_parametri(self.filtro_var.get())
 
+        # Filtra solo la luminanza (Y) e riporta la differenza su R, G e B
+        self.luminanza_var = tk.BooleanVar(value=False)
+        self.chk_luminanza = tk.Checkbutton(self, text="Solo luminanza", variable=self.luminanza_var,
+                                            command=self.notifica)
+        self.chk_luminanza.pack(side="left", padx=5)
+
         self.btn_up = tk.Button(self, text="↑", command=self.move_up_callback)
         self.btn_up.pack(side="left", padx=2)
 
@@ -73,26 +80,65 @@ class FiltroFrame(tk.Frame):
             entry = tk.Entry(self.parametri_frame, width=5)
             entry.insert(0, "3")
             entry.pack(side="left", padx=2)
+            entry.bind("<KeyRelease>", lambda event: self.notifica())
             self.parametri_entries[param] = entry
 
+        # Precisione dei calcoli, solo per i filtri che la prevedono
+        from filters import PRECISION_FILTERS
+        self.precisione_var = None
+        precisioni = PRECISION_FILTERS.get(FILTRI[filtro_name]["func"])
+        if precisioni:
+            self.precisione_var = tk.StringVar(value="predefinita")
+            menu = tk.OptionMenu(self.parametri_frame, self.precisione_var, "predefinita", *precisioni,
+                                 command=lambda _: self.notifica())
+            menu.pack(side="left", padx=2)
+
+    def cambia_filtro(self, filtro_name):
+        self.update_parametri(filtro_name)
+        self.notifica()
+
+    def notifica(self):
+        if self.change_callback:
+            self.change_callback()
+
+    def imposta(self, filtro_name, params):
+        # Mostra un filtro già scelto (es. dai suggerimenti di noise.py)
+        self.filtro_var.set(filtro_name)
+        self.update_parametri(filtro_name)
+        for param, entry in self.parametri_entries.items():
+            if param in params:
+                entry.delete(0, "end")
+                entry.insert(0, str(params[param]))
+        if self.precisione_var is not None and params.get("precision"):
+            self.precisione_var.set(params["precision"])
+        self.luminanza_var.set(bool(params.get("luminance")))
+
     def get_filtro(self):
         filtro_name = self.filtro_var.get()
         func = FILTRI[filtro_name]["func"]
         params = {}
         for param, entry in self.parametri_entries.items():
-            val = entry.get()
-            params[param] = float(val) if "." in val else int(val)
+            params[param] = parse_param(entry.get())
+        if self.precisione_var is not None and self.precisione_var.get() != "predefinita":
+            params["precision"] = self.precisione_var.get()
+        if self.luminanza_var.get():
+            params["luminance"] = True
         return (filtro_name, func, params)
 
 def scegli_immagine():
-    global selected_image, img_preview_before
+    global selected_image, selected_image_key, img_preview_before
+    from PIL import Image, ImageTk
+    from cache import image_key
+    from utils import load_image
     path = filedialog.askopenfilename(filetypes=[("Immagini", "*.jpg *.png *.jpeg")])
     if path:
         selected_image = load_image(path)
+        selected_image_key = image_key(selected_image)
         image = Image.open(path).resize((350, 350))
         img_preview_before = ImageTk.PhotoImage(image)
         canvas_before.create_image(0, 0, anchor="nw", image=img_preview_before)
         label_path.config(text=os.path.basename(path))
+        prepara_proxy()
 
 def scegli_cartella():
     global output_folder
@@ -104,22 +150,45 @@ def aggiungi_filtro():
     def remove():
         filtro_frame.destroy()
         filtro_frames.remove(filtro_frame)
+        programma_anteprima()
 
     def move_up():
         idx = filtro_frames.index(filtro_frame)
         if idx > 0:
             filtro_frames[idx], filtro_frames[idx - 1] = filtro_frames[idx - 1], filtro_frames[idx]
             refresh_filtro_list()
+            programma_anteprima()
 
     def move_down():
         idx = filtro_frames.index(filtro_frame)
         if idx < len(filtro_frames) - 1:
             filtro_frames[idx], filtro_frames[idx + 1] = filtro_frames[idx + 1], filtro_frames[idx]
             refresh_filtro_list()
+            programma_anteprima()
 
-    filtro_frame = FiltroFrame(frame_filtri_lista, remove, move_up, move_down)
+    filtro_frame = FiltroFrame(frame_filtri_lista, remove, move_up, move_down, programma_anteprima)
     filtro_frames.append(filtro_frame)
     refresh_filtro_list()
+    programma_anteprima()
+    return filtro_frame
+
+def suggerisci_filtri():
+    # Stima il rumore su un campione di pixel e sostituisce la catena con quella consigliata
+    if selected_image is None:
+        messagebox.showerror("Errore", "Carica prima un'immagine.")
+        return
+    from noise import describe as describe_noise, estimate_noise, recommend_chain
+    stima = estimate_noise(selected_image)
+    label_rumore.config(text=describe_noise(stima))
+    filtri = recommend_chain(stima, selected_image.shape)
+    for frame in filtro_frames:
+        frame.destroy()
+    filtro_frames.clear()
+    for nome, _, params in filtri:
+        aggiungi_filtro().imposta(nome, params)
+    programma_anteprima()
+    if not filtri:
+        messagebox.showinfo("Suggerimento", "Nessun rumore da togliere: la catena è vuota.")
 
 def refresh_filtro_list():
     for widget in frame_filtri_lista.winfo_children():
@@ -127,13 +196,155 @@ def refresh_filtro_list():
     for frame in filtro_frames:
         frame.pack(fill="x", pady=3)
 
-def stats(img):
-    if img.ndim == 2:
-        return [(np.mean(img), np.var(img))]
-    return [(np.mean(img[:, :, c]), np.var(img[:, :, c])) for c in range(img.shape[2])]
+#  ANTEPRIMA
+
+def prepara_proxy():
+    """
+    Calcola l'immagine ridotta (o il ritaglio) dell'anteprima: una volta per
+    immagine e modalità, non a ogni modifica dei filtri.
+    """
+    if selected_image is None:
+        return
+    from cache import image_key
+    from preview import PREVIEW_SIZE, make_proxy
+    proxy, scale = make_proxy(selected_image, PREVIEW_SIZE, modo_anteprima.get())
+    anteprima.update(proxy=proxy, key=image_key(proxy), scale=scale)
+    programma_anteprima()
+
+
+def programma_anteprima():
+    """
+    Ricalcola l'anteprima PREVIEW_DELAY ms dopo l'ultima modifica (debounce):
+    mentre si scrive un parametro non parte un calcolo per ogni tasto.
+    """
+    if anteprima["timer"] is not None:
+        root.after_cancel(anteprima["timer"])
+        anteprima["timer"] = None
+    if anteprima_attiva.get() and anteprima["proxy"] is not None and filtro_frames:
+        anteprima["timer"] = root.after(PREVIEW_DELAY, avvia_anteprima)
+
+
+def avvia_anteprima():
+    anteprima["timer"] = None
+    if anteprima["thread"] is not None:
+        # Un'anteprima alla volta: la si rifà quando finisce quella in corso
+        anteprima["di_nuovo"] = True
+        return
+    try:
+        filtri = [f.get_filtro() for f in filtro_frames]
+    except ValueError:
+        return  # parametro scritto a metà: si aspetta la prossima modifica
+
+    from cache import run_chain_cached
+    from preview import preview_chain
+    filtri = preview_chain(filtri, anteprima["scale"])
+    cache = get_cache("anteprima")
+    coda = queue.Queue()
+
+    def calcola():
+        try:
+            coda.put(("done", run_chain_cached(anteprima["proxy"], filtri, cache, anteprima["key"])))
+        except Exception as exc:
+            coda.put(("error", exc))
+
+    anteprima.update(coda=coda, di_nuovo=False, thread=threading.Thread(target=calcola, daemon=True))
+    anteprima["thread"].start()
+    label_anteprima.config(text="Anteprima: calcolo...")
+    root.after(30, controlla_anteprima)
+
+
+def controlla_anteprima():
+    global img_preview_after
+    try:
+        tipo, risultato = anteprima["coda"].get_nowait()
+    except queue.Empty:
+        root.after(30, controlla_anteprima)
+        return
+    anteprima.update(thread=None, coda=None)
+
+    if tipo == "done":
+        import numpy as np
+        from PIL import Image, ImageTk
+        image_out = Image.fromarray(np.asarray(risultato).astype(np.uint8)).resize((350, 350))
+        img_preview_after = ImageTk.PhotoImage(image_out)
+        canvas_after.create_image(0, 0, anchor="nw", image=img_preview_after)
+        label_anteprima.config(text=f"Anteprima ({modo_anteprima.get()}, scala {anteprima['scale']:.2f})")
+    else:
+        label_anteprima.config(text=f"Anteprima non disponibile: {risultato}")
+
+    if anteprima["di_nuovo"]:
+        avvia_anteprima()
+
+
+#  ELABORAZIONE A PIENA RISOLUZIONE
+
+class Annullato(Exception):
+    pass
+
+
+# Elaborazione in corso: thread, coda dei messaggi e richiesta di annullamento
+lavoro = {"thread": None, "coda": None, "annulla": None}
+
+# Lato dei tasselli per l'avanzamento: un tassello è anche il punto in cui
+# si può annullare a metà di un filtro
+TILE_SIZE = 256
+
+# Lato minimo di un tassello rispetto al bordo (halo) del filtro: con bordi
+# grandi (es. piramidi profonde) tasselli piccoli rifiltrerebbero più volte
+# la stessa area
+TILE_HALO_RATIO = 4
+
+
+def esegui_catena(image, key, filtri, coda, annulla, memoria=False):
+    """
+    Eseguita nel thread di lavoro: applica la catena (riusando la cache) a
+    tasselli e manda i messaggi di avanzamento nella coda. Non tocca Tk.
+    Il messaggio finale contiene anche il profilo (tempi per stadio e canale;
+    con memoria=True anche la memoria allocata, misurata con tracemalloc).
+    """
+    from cache import run_chain_cached
+    from filters import apply_filter_to_channels
+    from tiling import chain_radius, process_tiled, tile_exact
+    n = len(filtri)
+    fatti = [0]
+
+    def compute(image, func, params):
+        filtro = [filtri[fatti[0]]]
+        tile_size = max(TILE_SIZE, TILE_HALO_RATIO * chain_radius(filtro))
+        if not tile_exact(filtro) or 2 * tile_size >= max(image.shape[:2]):
+            # Immagine intera: il bilaterale approssimato lo richiede, e con al
+            # più due tasselli per lato i bordi costerebbero quasi quanto
+            # l'immagine. Si annulla a fine stadio
+            filtered = apply_filter_to_channels(image, func, **params)
+            if annulla.is_set():
+                raise Annullato()
+            return filtered
+
+        def progress(done, total):
+            if annulla.is_set():
+                raise Annullato()
+            coda.put(("progress", (fatti[0] + done / total) / n))
+
+        return process_tiled(image, filtro, tile_size=tile_size, progress=progress)
+
+    def on_stage(i, nome, params, from_cache, seconds):
+        fatti[0] = i + 1
+        coda.put(("stage", i, nome, params, from_cache, seconds))
+        coda.put(("progress", (i + 1) / n))
+
+    try:
+        with Profiler(memory=memoria) as profilo:
+            filtered = run_chain_cached(image, filtri, get_cache("risultati"), key, on_stage, compute)
+        coda.put(("done", filtered, profilo))
+    except Annullato:
+        coda.put(("cancelled",))
+    except Exception as exc:
+        coda.put(("error", exc))
+
 
 def applica_filtri():
-    global selected_image, output_folder, img_preview_after
+    if lavoro["thread"] is not None:
+        return
     if selected_image is None:
         messagebox.showerror("Errore", "Carica prima un'immagine.")
         return
@@ -146,34 +357,110 @@ def applica_filtri():
 
     os.makedirs(output_folder, exist_ok=True)
 
-    filtri_da_applicare = [f.get_filtro() for f in filtro_frames]
-
-    filtered = selected_image
-    start_time = time.time()
-    descrizioni = []
-
-    progress["maximum"] = len(filtri_da_applicare)
-    for i, (nome, func, params) in enumerate(filtri_da_applicare):
-        step_start = time.time()
-        filtered = apply_filter_to_channels(filtered, func, **params)
-        step_time = time.time() - step_start
+    try:
+        filtri_da_applicare = [f.get_filtro() for f in filtro_frames]
+    except ValueError as exc:
+        messagebox.showerror("Errore", str(exc))
+        return
 
-        descrizioni.append(f"{nome} {params}")
-        progress["value"] = i + 1
+    stato = {
+        "filtri": filtri_da_applicare,
+        "descrizioni": [],
+        "start_time": time.time(),
+        # Inizio del lavoro vero (dopo gli stadi in cache), per la stima del tempo
+        "calcolo": None,
+    }
+    lavoro["coda"] = queue.Queue()
+    lavoro["annulla"] = threading.Event()
+    lavoro["thread"] = threading.Thread(
+        target=esegui_catena,
+        args=(selected_image, selected_image_key, filtri_da_applicare, lavoro["coda"], lavoro["annulla"],
+              profilo_memoria.get()),
+        daemon=True,
+    )
+
+    progress["maximum"] = 1000
+    btn_applica.config(state="disabled")
+    btn_annulla.config(state="normal")
+    lavoro["thread"].start()
+    root.after(50, controlla_coda, stato)
+
+
+def annulla_filtri():
+    if lavoro["annulla"] is not None:
+        lavoro["annulla"].set()
+        btn_annulla.config(state="disabled")
+        time_remaining_text.set("Annullamento in corso...")
+
+
+def controlla_coda(stato):
+    """
+    Legge i messaggi del thread di lavoro e aggiorna l'interfaccia; si
+    ripianifica con root.after finché l'elaborazione non termina.
+    """
+    while True:
+        try:
+            messaggio = lavoro["coda"].get_nowait()
+        except queue.Empty:
+            break
+        tipo = messaggio[0]
+
+        if tipo == "progress":
+            aggiorna_avanzamento(stato, messaggio[1])
+        elif tipo == "stage":
+            _, i, nome, params, from_cache, seconds = messaggio
+            stato["descrizioni"].append(f"{nome} {params}" + (" (dalla cache)" if from_cache else f" [{seconds:.2f} sec]"))
+        else:
+            fine_elaborazione()
+            if tipo == "done":
+                salva_risultato(stato, messaggio[1], messaggio[2])
+            elif tipo == "error":
+                messagebox.showerror("Errore", f"Elaborazione non riuscita:\n{messaggio[1]}")
+            return
+
+    root.after(50, controlla_coda, stato)
+
+
+def aggiorna_avanzamento(stato, frazione):
+    progress["value"] = int(frazione * 1000)
+    percent.set(f"{int(frazione * 100)}%")
+
+    # Stima dalla velocità media dall'inizio del calcolo (gli stadi presi
+    # dalla cache non contano), non dalla durata dell'ultimo filtro
+    adesso = time.time()
+    if stato["calcolo"] is None:
+        stato["calcolo"] = (adesso, frazione)
+        return
+    t0, f0 = stato["calcolo"]
+    if frazione > f0 and adesso - t0 > 0.5:
+        remaining = (adesso - t0) / (frazione - f0) * (1 - frazione)
+        time_remaining_text.set(f"Tempo stimato rimanente: {remaining:.1f} sec")
 
-        pct = int((i + 1) / len(filtri_da_applicare) * 100)
-        percent.set(f"{pct}%")
 
-        remaining = (len(filtri_da_applicare) - (i + 1)) * step_time
-        time_remaining_text.set(f"Tempo stimato rimanente: {remaining:.1f} sec")
+def fine_elaborazione():
+    lavoro.update(thread=None, coda=None, annulla=None)
+    btn_applica.config(state="normal")
+    btn_annulla.config(state="disabled")
+    # Reset UI per nuova esecuzione
+    progress["value"] = 0
+    percent.set("0%")
+    time_remaining_text.set("Tempo stimato rimanente: --")
 
-        root.update_idletasks()
 
+def salva_risultato(stato, filtered, profilo):
+    global img_preview_after
+    import numpy as np
+    from PIL import Image, ImageTk
+    from noise import describe as describe_noise, estimate_noise
+    from utils import save_image, stats
     end_time = time.time()
 
     output_path = os.path.join(output_folder, "output.jpg")
     log_path = os.path.join(output_folder, "log.txt")
     save_image(filtered, output_path)
+    # Eventi completi: JSON Lines e traccia da aprire in chrome://tracing o Perfetto
+    profilo.write_jsonl(os.path.join(output_folder, "profilo.jsonl"))
+    profilo.write_chrome_trace(os.path.join(output_folder, "profilo_trace.json"))
 
     stats_before = stats(selected_image)
     stats_after = stats(filtered)
@@ -184,67 +471,103 @@ def applica_filtri():
             delta = b[1] - a[1]
             perc_var = (delta / b[1]) * 100 if b[1] != 0 else 0
             log.write(f"Canale {i}: prima μ={b[0]:.2f}, σ²={b[1]:.2f} → dopo μ={a[0]:.2f}, σ²={a[1]:.2f} ➜ -{perc_var:.1f}%\n")
+        log.write(f"\nRumore stimato prima: {describe_noise(estimate_noise(selected_image))}\n")
+        log.write(f"Rumore stimato dopo: {describe_noise(estimate_noise(filtered))}\n")
         log.write("\nFiltri applicati:\n")
-        for d in descrizioni:
+        for d in stato["descrizioni"]:
             log.write(f" - {d}\n")
-        log.write(f"\nTempo esecuzione: {end_time - start_time:.2f} sec\n")
+        log.write("\nProfilo per stadio:\n")
+        for riga in profilo.summary():
+            log.write(f" - {riga}\n")
+        log.write(f"\nTempo esecuzione: {end_time - stato['start_time']:.2f} sec\n")
         log.write(f"Salvato in: {output_path}\n")
         log.write(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
 
     image_out = Image.fromarray(filtered.astype(np.uint8)).resize((350, 350))
     img_preview_after = ImageTk.PhotoImage(image_out)
     canvas_after.create_image(0, 0, anchor="nw", image=img_preview_after)
+    label_anteprima.config(text="Risultato a piena risoluzione")
 
     messagebox.showinfo(" Fatto", f"Filtri applicati correttamente.\nFile salvati in:\n{output_folder}")
-    # Reset UI per nuova esecuzione
-    progress["value"] = 0
-    percent.set("0%")
-    time_remaining_text.set("Tempo stimato rimanente: --")
-
-
-#  INTERFACCIA GRAFICA 
-
-root = tk.Tk()
-root.title("Image Denoising - GUI")
-root.geometry("1100x700")
-percent = tk.StringVar(value="0%")
-time_remaining_text = tk.StringVar(value="Tempo stimato rimanente: --")
-
-# Frame sinistro
-frame_img = tk.Frame(root)
-frame_img.pack(side="left", padx=10, pady=10)
-
-tk.Label(frame_img, text="PRIMA").pack()
-canvas_before = tk.Canvas(frame_img, width=350, height=350, bg="lightgray")
-canvas_before.pack()
-
-tk.Label(frame_img, text="DOPO").pack()
-canvas_after = tk.Canvas(frame_img, width=350, height=350, bg="lightgray")
-canvas_after.pack()
-
-# Frame destro
-frame_ctrl = tk.Frame(root)
-frame_ctrl.pack(side="right", fill="both", expand=True, padx=10, pady=10)
-
-tk.Button(frame_ctrl, text=" Carica immagine", command=scegli_immagine).pack()
-label_path = tk.Label(frame_ctrl, text="Nessuna immagine selezionata")
-label_path.pack(pady=5)
-
-tk.Button(frame_ctrl, text=" Seleziona cartella output", command=scegli_cartella).pack()
-label_output = tk.Label(frame_ctrl, text="Nessuna cartella selezionata")
-label_output.pack(pady=5)
-
-tk.Label(frame_ctrl, text=" Filtri da applicare").pack(pady=(10, 0))
-frame_filtri_lista = tk.Frame(frame_ctrl)
-frame_filtri_lista.pack(pady=5, fill="x")
-
-tk.Button(frame_ctrl, text="Aggiungi filtro", command=aggiungi_filtro).pack(pady=5)
-
-progress = ttk.Progressbar(frame_ctrl, length=300, mode="determinate")
-progress.pack(pady=(10, 0))
-tk.Label(frame_ctrl, textvariable=percent).pack()
-tk.Label(frame_ctrl, textvariable=time_remaining_text).pack()
 
-tk.Button(frame_ctrl, text=" Applica filtri", command=applica_filtri, bg="green", fg="white").pack(pady=20)
 
-root.mainloop()
+#  INTERFACCIA GRAFICA
+
+def main():
+    """
+    Costruisce la finestra e avvia il ciclo di Tk: importare gui.py non apre
+    nessuna finestra, così le sue funzioni si possono riusare.
+    """
+    global root, percent, time_remaining_text, canvas_before, canvas_after, label_anteprima, label_path
+    global label_output, frame_filtri_lista, label_rumore, anteprima_attiva, modo_anteprima, progress
+    global profilo_memoria, btn_applica, btn_annulla
+
+    root = tk.Tk()
+    root.title("Image Denoising - GUI")
+    root.geometry("1100x700")
+    percent = tk.StringVar(value="0%")
+    time_remaining_text = tk.StringVar(value="Tempo stimato rimanente: --")
+
+    # Frame sinistro
+    frame_img = tk.Frame(root)
+    frame_img.pack(side="left", padx=10, pady=10)
+
+    tk.Label(frame_img, text="PRIMA").pack()
+    canvas_before = tk.Canvas(frame_img, width=350, height=350, bg="lightgray")
+    canvas_before.pack()
+
+    tk.Label(frame_img, text="DOPO").pack()
+    canvas_after = tk.Canvas(frame_img, width=350, height=350, bg="lightgray")
+    canvas_after.pack()
+    label_anteprima = tk.Label(frame_img, text="")
+    label_anteprima.pack()
+
+    # Frame destro
+    frame_ctrl = tk.Frame(root)
+    frame_ctrl.pack(side="right", fill="both", expand=True, padx=10, pady=10)
+
+    tk.Button(frame_ctrl, text=" Carica immagine", command=scegli_immagine).pack()
+    label_path = tk.Label(frame_ctrl, text="Nessuna immagine selezionata")
+    label_path.pack(pady=5)
+
+    tk.Button(frame_ctrl, text=" Seleziona cartella output", command=scegli_cartella).pack()
+    label_output = tk.Label(frame_ctrl, text="Nessuna cartella selezionata")
+    label_output.pack(pady=5)
+
+    tk.Label(frame_ctrl, text=" Filtri da applicare").pack(pady=(10, 0))
+    frame_filtri_lista = tk.Frame(frame_ctrl)
+    frame_filtri_lista.pack(pady=5, fill="x")
+
+    tk.Button(frame_ctrl, text="Aggiungi filtro", command=aggiungi_filtro).pack(pady=5)
+    tk.Button(frame_ctrl, text="Suggerisci filtri", command=suggerisci_filtri).pack()
+    label_rumore = tk.Label(frame_ctrl, text="")
+    label_rumore.pack(pady=(0, 5))
+
+    # Anteprima automatica: ridotta (immagine intera, finestre scalate) o ritaglio 1:1
+    frame_anteprima = tk.Frame(frame_ctrl)
+    frame_anteprima.pack(pady=5)
+    anteprima_attiva = tk.BooleanVar(value=True)
+    modo_anteprima = tk.StringVar(value="ridotta")
+    tk.Checkbutton(frame_anteprima, text="Anteprima automatica", variable=anteprima_attiva,
+                   command=programma_anteprima).pack(side="left")
+    tk.OptionMenu(frame_anteprima, modo_anteprima, "ridotta", "ritaglio",
+                  command=lambda _: prepara_proxy()).pack(side="left", padx=5)
+
+    progress = ttk.Progressbar(frame_ctrl, length=300, mode="determinate")
+    progress.pack(pady=(10, 0))
+    tk.Label(frame_ctrl, textvariable=percent).pack()
+    tk.Label(frame_ctrl, textvariable=time_remaining_text).pack()
+
+    profilo_memoria = tk.BooleanVar(value=False)
+    tk.Checkbutton(frame_ctrl, text="Misura la memoria (più lento)", variable=profilo_memoria).pack(pady=(10, 0))
+
+    btn_applica = tk.Button(frame_ctrl, text=" Applica filtri", command=applica_filtri, bg="green", fg="white")
+    btn_applica.pack(pady=(10, 5))
+    btn_annulla = tk.Button(frame_ctrl, text=" Annulla", command=annulla_filtri, state="disabled")
+    btn_annulla.pack()
+
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from filters import CHANNEL_OPTIONS, COUPLED_CHANNEL_FILTERS
+from tiling import apply_chain, chain_radius, filter_region
+
+
+# Righe minime per striscia: strisce troppo basse sprecano lavoro sul bordo
+MIN_STRIP_ROWS = 64
+
+# Array condivisi del processo worker, impostati da _init_worker
+_shared = {}
+
+
+def plan_tasks(shape, workers, strip_rows=None, split_channels=True):
+    """
+    Divide il lavoro in compiti (canale, y0, y1): ogni canale in strisce
+    orizzontali, in modo da avere circa 4 compiti per worker.
+    Per le immagini in scala di grigi, o con split_channels=False, il canale
+    è None (la striscia comprende tutti i canali).
+    """
+    height = shape[0]
+    channels = list(range(shape[2])) if len(shape) == 3 and split_channels else [None]
+    if strip_rows is None:
+        n_strips = max(1, -(-4 * workers // len(channels)))
+        strip_rows = max(MIN_STRIP_ROWS, -(-height // n_strips))
+    return [(c, y0, min(y0 + strip_rows, height)) for c in channels for y0 in range(0, height, strip_rows)]
+
+
+def _filter_strip(source, output, filtri, halo, channel, y0, y1):
+    """
+    Filtra le righe [y0, y1) di un canale con il bordo necessario alla catena
+    e le scrive in `output`.
+    """
+    plane = source if channel is None else source[:, :, channel]
+    target = output if channel is None else output[:, :, channel]
+    target[y0:y1] = filter_region(plane, filtri, y0, y1, 0, plane.shape[1], halo)
+
+
+def _shared_array(raw, shape, dtype):
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _init_worker(raw_in, raw_out, shape, in_dtype, out_dtype, filtri, halo):
+    _shared["source"] = _shared_array(raw_in, shape, in_dtype)
+    _shared["output"] = _shared_array(raw_out, shape, out_dtype)
+    _shared["filtri"] = filtri
+    _shared["halo"] = halo
+
+
+def _run_task(task):
+    _filter_strip(_shared["source"], _shared["output"], _shared["filtri"], _shared["halo"], *task)
+
+
+def _output_dtype(image, filtri):
+    # Il tipo di uscita dipende dai filtri (es. il bilaterale restituisce uint8):
+    # lo si ricava da una prova su un piccolo ritaglio
+    return apply_chain(np.array(image[:8, :8]), filtri).dtype
+
+
+def apply_parallel(image, filtri, workers=None, backend="process", strip_rows=None):
+    """
+    Applica una catena di filtri [(nome, func, params), ...] dividendo il
+    lavoro per canali e strisce orizzontali (con il bordo calcolato come in
+    tiling.chain_radius). Il risultato è identico a quello seriale.
+    - workers: numero di worker (default: numero di core); con 1 lavora nel
+      processo corrente
+    - backend: "process" (pool di processi con array condivisi, nessuna copia
+      dei pixel per compito) oppure "thread" (utile perché NumPy rilascia il
+      GIL durante le operazioni sugli array)
+    - strip_rows: altezza delle strisce (default: circa 4 compiti per worker)
+    """
+    workers = workers or os.cpu_count() or 1
+    halo = chain_radius(filtri)
+    # Luminanza, parametri per canale e filtri con i canali accoppiati hanno
+    # bisogno di tutti i canali insieme
+    split_channels = not any(
+        func in COUPLED_CHANNEL_FILTERS or any(params.get(option) for option in CHANNEL_OPTIONS)
+        for _, func, params in filtri
+    )
+    tasks = plan_tasks(image.shape, workers, strip_rows, split_channels)
+    out_dtype = _output_dtype(image, filtri)
+
+    if workers == 1 or backend == "thread":
+        output = np.empty(image.shape, dtype=out_dtype)
+        if workers == 1:
+            for task in tasks:
+                _filter_strip(image, output, filtri, halo, *task)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda task: _filter_strip(image, output, filtri, halo, *task), tasks))
+        return output
+
+    if backend != "process":
+        raise ValueError(f"Backend sconosciuto: {backend}")
+
+    # Ingresso e uscita in memoria condivisa: i worker ricevono solo le coordinate
+    raw_in = mp.RawArray("B", image.nbytes)
+    raw_out = mp.RawArray("B", int(np.prod(image.shape)) * np.dtype(out_dtype).itemsize)
+    _shared_array(raw_in, image.shape, image.dtype)[:] = image
+
+    initargs = (raw_in, raw_out, image.shape, image.dtype, out_dtype, filtri, halo)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        list(pool.map(_run_task, tasks))
+
+    # La vista tiene in vita il RawArray: nessuna copia finale
+    return _shared_array(raw_out, image.shape, out_dtype)
@@ -0,0 +1,265 @@
+import json
+import os
+
+import numpy as np
+
+from catalog import FILTRI, build_filtro, full_params
+from filters import (
+    CHANNEL_OPTIONS,
+    apply_filter_to_channels,
+    closing_filter,
+    convolve,
+    gaussian_filter,
+    gaussian_kernel_1d,
+    max_filter,
+    mean_filter,
+    min_filter,
+    opening_filter,
+    quantize,
+)
+from profiling import measure
+
+
+# Versione del formato dei file di pipeline
+FORMAT_VERSION = 1
+
+
+def _linear_kernel(func, params):
+    """
+    Kernel 1D (e indice del centro) dei filtri lineari separabili, None per gli
+    altri e per quelli con opzioni sui canali (luminanza, parametri per canale)
+    o con una precisione esplicita, che vengono eseguiti così come sono.
+    """
+    if _channel_options(params) or params.get("precision") is not None:
+        return None
+    params = full_params(func, params)
+    if func is mean_filter:
+        size = params["kernel_size"]
+        return np.full(size, 1.0 / size), size // 2
+    if func is gaussian_filter:
+        size = params["kernel_size"]
+        return gaussian_kernel_1d(size, params["sigma"]), size // 2
+    return None
+
+
+class LinearStep:
+    """
+    Passo eseguito come un'unica convoluzione separabile in virgola mobile:
+    più filtri lineari consecutivi fusi. Con i kernel fusi lunghi convolve
+    passa da sola alla FFT. source è il filtro originale (func, params)
+    finché il passo ne contiene uno solo.
+    """
+
+    def __init__(self, names, kernel, center, source=None):
+        self.names = names
+        self.kernel = kernel
+        self.center = center
+        self.source = source
+
+    def then(self, names, kernel, center):
+        # La composizione di due convoluzioni è la convoluzione dei kernel
+        return LinearStep(self.names + names, np.convolve(self.kernel, kernel), self.center + center)
+
+    def run(self, image):
+        return convolve(image, self.kernel, center=self.center)
+
+    def describe(self):
+        return f"{' + '.join(self.names)} → convoluzione separabile {len(self.kernel)}x{len(self.kernel)}"
+
+
+class FilterStep:
+    """
+    Passo eseguito con una funzione di filters.py sull'immagine già riportata
+    al tipo originale.
+    """
+
+    def __init__(self, names, func, params):
+        self.names = names
+        self.func = func
+        self.params = params
+
+    def run(self, image):
+        return apply_filter_to_channels(image, self.func, **self.params)
+
+    def describe(self):
+        params = ", ".join(f"{k}={v}" for k, v in self.params.items())
+        return f"{' + '.join(self.names)} → {self.func.__name__}({params})"
+
+
+def _fuse_rank(previous, func, params, name):
+    """
+    Fonde due filtri di rango consecutivi quando il risultato è identico:
+    - min → min (max → max): un solo minimo (massimo) con finestra k1 + k2 - 1,
+      se le due finestre non sono entrambe pari
+    - min → max (max → min) con la stessa finestra: apertura (chiusura)
+    Restituisce il nuovo passo oppure None.
+    """
+    rank_filters = (min_filter, max_filter)
+    if not isinstance(previous, FilterStep) or previous.func not in rank_filters or func not in rank_filters:
+        return None
+    if _channel_options(previous.params) or _channel_options(params):
+        return None
+    k1 = previous.params["kernel_size"]
+    k2 = full_params(func, params)["kernel_size"]
+    names = previous.names + [name]
+
+    if func is previous.func and func in (min_filter, max_filter) and (k1 % 2 or k2 % 2):
+        return FilterStep(names, func, {"kernel_size": k1 + k2 - 1})
+    if k1 == k2 and (previous.func, func) == (min_filter, max_filter):
+        return FilterStep(names, opening_filter, {"kernel_size": k1})
+    if k1 == k2 and (previous.func, func) == (max_filter, min_filter):
+        return FilterStep(names, closing_filter, {"kernel_size": k1})
+    return None
+
+
+class Pipeline:
+    """
+    Catena di filtri del catalogo (nome, parametri) salvabile in JSON/YAML.
+    Prima dell'esecuzione la catena viene analizzata (plan) e i passi
+    compatibili vengono fusi:
+    - due o più filtri di media e gaussiani consecutivi → una sola
+      convoluzione separabile, con un solo padding e risultato intermedio in
+      float64 (un filtro lineare da solo resta il filtro di filters.py, con
+      lo stesso risultato della GUI)
+    - min → max / max → min con la stessa finestra → apertura / chiusura
+    - min → min / max → max → un solo filtro con finestra più grande
+    Il risultato in virgola mobile dei filtri lineari fusi viene arrotondato
+    al tipo dell'immagine una sola volta, prima di un passo non lineare o
+    alla fine.
+    """
+
+    def __init__(self, stages=None):
+        self.stages = []
+        for nome, params in stages or []:
+            self.add(nome, **params)
+
+    @classmethod
+    def from_filtri(cls, filtri):
+        """
+        Crea la pipeline dalla lista [(nome, func, params), ...] della GUI.
+        """
+        return cls([(nome, params) for nome, _, params in filtri])
+
+    def add(self, nome, **params):
+        build_filtro(nome, params)  # controlla nome e parametri
+        self.stages.append((nome, dict(params)))
+        return self
+
+    @property
+    def filtri(self):
+        """
+        La catena non fusa nel formato [(nome, func, params), ...].
+        """
+        return [build_filtro(nome, params) for nome, params in self.stages]
+
+    def plan(self):
+        """
+        Lista dei passi da eseguire dopo la fusione (LinearStep / FilterStep).
+        """
+        steps = []
+        for nome, params in self.stages:
+            func = FILTRI[nome]["func"]
+            previous = steps[-1] if steps else None
+
+            linear = _linear_kernel(func, params)
+            if linear is not None:
+                if isinstance(previous, LinearStep):
+                    steps[-1] = previous.then([nome], *linear)
+                else:
+                    steps.append(LinearStep([nome], *linear, source=(func, full_params(func, params))))
+                continue
+
+            fused = _fuse_rank(previous, func, params, nome)
+            if fused is not None:
+                steps[-1] = fused
+            else:
+                steps.append(FilterStep([nome], func, full_params(func, params)))
+        # Senza nulla da fondere la convoluzione in float non serve
+        return [FilterStep(step.names, *step.source) if isinstance(step, LinearStep) and step.source else step
+                for step in steps]
+
+    def describe_plan(self):
+        return [step.describe() for step in self.plan()]
+
+    def run(self, image):
+        """
+        Esegue la pipeline fusa; il risultato ha lo stesso tipo dell'ingresso
+        (il bilaterale, come da solo, restituisce sempre uint8).
+        """
+        dtype = image.dtype
+        for step in self.plan():
+            if isinstance(step, FilterStep):
+                image = quantize(image, dtype)
+            with measure("stage", " + ".join(step.names), image.size, plan=step.describe()):
+                image = step.run(image)
+        return quantize(image, dtype)
+
+    # Serializzazione
+
+    def to_dict(self):
+        return {
+            "version": FORMAT_VERSION,
+            "stages": [{"name": nome, "params": params} for nome, params in self.stages],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Accetta {"version": 1, "stages": [...]} oppure direttamente la lista
+        degli stadi [{"name": ..., "params": {...}}, ...].
+        """
+        stages = data["stages"] if isinstance(data, dict) else data
+        if isinstance(data, dict) and data.get("version", FORMAT_VERSION) > FORMAT_VERSION:
+            raise ValueError(f"Versione del formato non supportata: {data['version']}")
+        return cls([(stage["name"], stage.get("params") or {}) for stage in stages])
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    def to_yaml(self):
+        return _yaml().safe_dump(self.to_dict(), allow_unicode=True, sort_keys=False)
+
+    @classmethod
+    def from_yaml(cls, text):
+        return cls.from_dict(_yaml().safe_load(text))
+
+    def save(self, path):
+        """
+        Salva in JSON o YAML a seconda dell'estensione (.json, .yaml, .yml).
+        """
+        text = self.to_yaml() if _is_yaml(path) else self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        return cls.from_yaml(text) if _is_yaml(path) else cls.from_json(text)
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __repr__(self):
+        return f"Pipeline({self.stages!r})"
+
+
+def _channel_options(params):
+    return any(params.get(option) for option in CHANNEL_OPTIONS)
+
+
+def _is_yaml(path):
+    return os.path.splitext(path)[1].lower() in (".yaml", ".yml")
+
+
+def _yaml():
+    # PyYAML è opzionale: serve solo per i file .yaml/.yml
+    try:
+        import yaml
+    except ImportError as exc:
+        raise ImportError("Per leggere/scrivere pipeline YAML installare PyYAML (pip install pyyaml)") from exc
+    return yaml
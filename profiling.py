@@ -0,0 +1,218 @@
+import itertools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Callback registrate: ognuna riceve un dizionario per ogni misura conclusa
+_hooks = []
+
+# Misure aperte del thread corrente (uno stadio contiene le chiamate per canale)
+_local = threading.local()
+_ids = itertools.count()
+
+
+def add_hook(callback):
+    """
+    Registra callback(event), chiamata alla fine di ogni stadio di una catena
+    e di ogni chiamata di un filtro su un canale. Restituisce la callback,
+    così si può usare come decoratore.
+    """
+    _hooks.append(callback)
+    return callback
+
+
+def remove_hook(callback):
+    if callback in _hooks:
+        _hooks.remove(callback)
+
+
+@contextmanager
+def hook(callback):
+    add_hook(callback)
+    try:
+        yield callback
+    finally:
+        remove_hook(callback)
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def measure(kind, name, pixels, **extra):
+    """
+    Misura il blocco e invia l'evento alle callback registrate:
+    - kind: "stage" (uno stadio di una catena) o "channel" (un filtro su un canale)
+    - wall e cpu (del thread) in secondi, pixels e pixels_per_sec
+    - alloc_bytes: picco di memoria allocata durante il blocco, solo se
+      tracemalloc è attivo (altrimenti None)
+    Senza callback registrate non misura nulla.
+    """
+    if not _hooks:
+        yield
+        return
+
+    stack = _stack()
+    tracing = tracemalloc.is_tracing()
+    frame = {"id": next(_ids), "name": name, "base": 0, "peak": 0}
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            # Il picco visto finora appartiene alla misura esterna
+            stack[-1]["peak"] = max(stack[-1]["peak"], peak - stack[-1]["base"])
+        tracemalloc.reset_peak()
+        frame["base"] = current
+    stack.append(frame)
+
+    start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - start, time.thread_time() - cpu_start
+        stack.pop()
+        alloc = None
+        if tracing and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            alloc = max(frame["peak"], peak - frame["base"])
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak - stack[-1]["base"])
+            tracemalloc.reset_peak()
+
+        event = {
+            "kind": kind,
+            "name": name,
+            "id": frame["id"],
+            "stage": stack[-1]["name"] if stack else None,
+            "stage_id": stack[-1]["id"] if stack else None,
+            "start": start,
+            "wall": wall,
+            "cpu": cpu,
+            "alloc_bytes": alloc,
+            "pixels": pixels,
+            "pixels_per_sec": pixels / wall if wall > 0 else None,
+            "thread": threading.get_ident(),
+            **extra,
+        }
+        for callback in list(_hooks):
+            callback(event)
+
+
+class Profiler:
+    """
+    Raccoglie gli eventi delle misure del thread in cui viene usato:
+
+        with Profiler(memory=True) as prof:
+            run_chain_cached(image, filtri, cache)
+        prof.write_jsonl("profilo.jsonl")
+        prof.write_chrome_trace("profilo.json")  # chrome://tracing o Perfetto
+
+    - memory: attiva tracemalloc per misurare la memoria allocata (rallenta
+      le allocazioni, quindi è disattivato di default)
+    - callback: chiamata anche lei con ogni evento raccolto
+    I filtri eseguiti in altri processi (parallel, cli) non vengono visti.
+    """
+
+    def __init__(self, memory=False, callback=None):
+        self.memory = memory
+        self.callback = callback
+        self.events = []
+        self._started_tracing = False
+        self._thread = None
+
+    def _record(self, event):
+        if event["thread"] != self._thread:
+            return
+        self.events.append(event)
+        if self.callback:
+            self.callback(event)
+
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        add_hook(self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        remove_hook(self._record)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def write_jsonl(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for event in self.events:
+                f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+    def chrome_trace(self):
+        """
+        Eventi nel formato Trace Event di Chrome (eventi completi "X", tempi in µs).
+        """
+        origin = min((e["start"] for e in self.events), default=0)
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": e["name"] if e.get("channel") is None else f"{e['name']} [c{e['channel']}]",
+                    "cat": e["kind"],
+                    "ph": "X",
+                    "ts": (e["start"] - origin) * 1e6,
+                    "dur": e["wall"] * 1e6,
+                    "pid": pid,
+                    "tid": e["thread"],
+                    "args": {k: v for k, v in e.items() if k not in ("start", "wall", "thread", "kind", "name", "id")},
+                }
+                for e in self.events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False, default=str)
+
+    def summary(self):
+        """
+        Righe di riepilogo per stadio e, sotto, per canale (sommando le
+        chiamate sui tasselli), nell'ordine di esecuzione.
+        """
+        righe = []
+        canali = {}
+        for e in self.events:
+            if e["kind"] == "channel":
+                somma = canali.setdefault((e["stage_id"], e.get("channel")), {"wall": 0.0, "cpu": 0.0, "pixels": 0, "alloc": None})
+                somma["wall"] += e["wall"]
+                somma["cpu"] += e["cpu"]
+                somma["pixels"] += e["pixels"]
+                if e["alloc_bytes"] is not None:
+                    somma["alloc"] = max(somma["alloc"] or 0, e["alloc_bytes"])
+
+        for e in self.events:
+            if e["kind"] != "stage":
+                continue
+            if e.get("from_cache"):
+                righe.append(f"{e['name']}: dalla cache")
+                continue
+            righe.append(f"{e['name']}: {_format(e['wall'], e['cpu'], e['pixels'], e['alloc_bytes'])}")
+            for (stage_id, channel), somma in canali.items():
+                if stage_id == e["id"]:
+                    nome = "tutti i canali" if channel is None else f"canale {channel}"
+                    righe.append(f"    {nome}: {_format(somma['wall'], somma['cpu'], somma['pixels'], somma['alloc'])}")
+        return righe
+
+
+def _format(wall, cpu, pixels, alloc):
+    testo = f"{wall:.3f} s (CPU {cpu:.3f} s)"
+    if wall > 0 and pixels:
+        testo += f", {pixels / wall / 1e6:.2f} Mpx/s"
+    if alloc is not None:
+        testo += f", picco {alloc / 2**20:.1f} MB"
+    return testo
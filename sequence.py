@@ -0,0 +1,272 @@
+import argparse
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from collections import deque
+from itertools import repeat
+
+import numpy as np
+
+from cli import find_inputs, output_path_for, parse_filtro
+from filters import quantize
+from pipeline import Pipeline
+from utils import load_image, save_image
+
+
+# Fotogrammi decodificati in anticipo e in attesa di scrittura: limita la memoria
+QUEUE_FRAMES = 8
+
+TEMPORAL_MODES = ("median", "mean")
+
+# Segnale di fine sequenza nelle code
+_END = object()
+
+
+def _natural_key(path):
+    # frame_2.png prima di frame_10.png anche senza zeri iniziali
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", os.path.basename(path))]
+
+
+def find_frames(sorgenti):
+    """
+    Fotogrammi di una sequenza (cartelle, file o pattern glob come in
+    cli.find_inputs) in ordine numerico.
+    """
+    return sorted(find_inputs(sorgenti), key=_natural_key)
+
+
+def _edge_padded(frames, pad):
+    # Primo e ultimo fotogramma ripetuti `pad` volte, come il padding 'edge'
+    last = None
+    for frame in frames:
+        if last is None:
+            yield from repeat(frame, pad)
+        elif frame.shape != last.shape:
+            raise ValueError(f"I fotogrammi devono avere tutti la stessa forma: {frame.shape} invece di {last.shape}")
+        yield frame
+        last = frame
+    if last is not None:
+        yield from repeat(last, pad)
+
+
+def _sorted_replace(stack, old, new):
+    """
+    Pila ordinata lungo l'asse 0 in cui, pixel per pixel, `old` viene
+    sostituito da `new`: new prende il posto di old e poi una passata in su
+    e una in giù (scambi con minimo e massimo) lo portano al suo posto,
+    O(window) operazioni invece di riordinare.
+    """
+    n = len(stack)
+    k_old = np.zeros(old.shape, dtype=np.uint8 if n < 256 else np.int64)
+    for level in stack:
+        k_old += level < old
+    for i, level in enumerate(stack):
+        np.copyto(level, new, where=k_old == i)
+    for i in list(range(n - 1)) + list(range(n - 2, -1, -1)):
+        low = np.minimum(stack[i], stack[i + 1])
+        np.maximum(stack[i], stack[i + 1], out=stack[i + 1])
+        stack[i] = low
+    return stack
+
+
+def temporal_filter(frames, window=3, mode="median"):
+    """
+    Filtro temporale su una sequenza (iterabile) di fotogrammi della stessa
+    forma: ogni fotogramma in uscita è la mediana o la media dei `window`
+    fotogrammi centrati su di esso, con il primo e l'ultimo ripetuti ai bordi.
+    Generatore: tiene in memoria solo la finestra e restituisce ogni
+    fotogramma con window // 2 fotogrammi di ritardo. La finestra viene
+    aggiornata con il fotogramma che entra e quello che esce (somma per la
+    media, pila ordinata per la mediana), senza ricalcolarla.
+    """
+    if mode not in TEMPORAL_MODES:
+        raise ValueError(f"Modalità temporale sconosciuta: {mode!r}. Disponibili: {', '.join(TEMPORAL_MODES)}")
+    if window < 1 or window % 2 == 0:
+        raise ValueError("window deve essere un numero dispari positivo")
+
+    finestra = deque()
+    state = None
+    for frame in _edge_padded(frames, window // 2):
+        finestra.append(frame)
+        if len(finestra) < window:
+            continue
+        if state is None:
+            stack = np.stack(finestra)
+            if mode == "median":
+                state = np.sort(stack, axis=0)
+            else:
+                state = stack.sum(axis=0, dtype=np.int64 if np.issubdtype(frame.dtype, np.integer) else np.float64)
+        else:
+            leaving = finestra.popleft()
+            if mode == "median":
+                _sorted_replace(state, leaving, frame)
+            else:
+                state += frame
+                state -= leaving
+
+        if mode == "median":
+            yield state[window // 2].copy()
+        else:
+            yield quantize(state / window, frame.dtype)
+
+
+def _put(q, item, stop):
+    # put bloccante che si arrende se l'altra parte si è fermata
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _read_frames(paths, frames, stop, tempi):
+    try:
+        for path in paths:
+            start = time.perf_counter()
+            frame = load_image(path)
+            tempi["read"] += time.perf_counter() - start
+            if not _put(frames, frame, stop):
+                return
+        _put(frames, _END, stop)
+    except BaseException as exc:
+        _put(frames, exc, stop)
+
+
+def _write_frames(pending, stop, tempi, errori):
+    while not stop.is_set():
+        try:
+            item = pending.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _END:
+            return
+        try:
+            start = time.perf_counter()
+            save_image(*item)
+            tempi["write"] += time.perf_counter() - start
+        except BaseException as exc:
+            errori.append(exc)
+            stop.set()
+
+
+def _drain(frames, tempi):
+    while True:
+        start = time.perf_counter()
+        item = frames.get()
+        tempi["wait"] += time.perf_counter() - start
+        if item is _END:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def process_sequence(paths, output_paths, pipeline=None, window=3, mode="median", queue_frames=QUEUE_FRAMES,
+                     progress=None):
+    """
+    Filtra una sequenza di fotogrammi a flusso continuo:
+    - un thread legge e decodifica i fotogrammi in anticipo, in una coda di
+      al massimo queue_frames fotogrammi
+    - il thread principale applica temporal_filter (window=1: nessun filtro
+      temporale) e poi la pipeline spaziale a ogni fotogramma
+    - un thread scrive i fotogrammi finiti mentre i successivi vengono filtrati
+    - progress(done, total): chiamata dopo ogni fotogramma filtrato
+    Restituisce frames, seconds, fps e i secondi spesi a leggere, filtrare e
+    scrivere (le tre fasi si sovrappongono, quindi la più lenta limita fps).
+    """
+    if len(paths) != len(output_paths):
+        raise ValueError("Serve un percorso di uscita per ogni fotogramma")
+    frames, pending = queue.Queue(queue_frames), queue.Queue(queue_frames)
+    stop = threading.Event()
+    tempi = {"read": 0.0, "filter": 0.0, "write": 0.0, "wait": 0.0}
+    errori = []
+    reader = threading.Thread(target=_read_frames, args=(paths, frames, stop, tempi), daemon=True)
+    writer = threading.Thread(target=_write_frames, args=(pending, stop, tempi, errori), daemon=True)
+
+    start = time.perf_counter()
+    reader.start()
+    writer.start()
+    done = 0
+    try:
+        decoded = _drain(frames, tempi)
+        filtered = temporal_filter(decoded, window, mode) if window > 1 else decoded
+        while True:
+            # Il tempo dei filtri esclude l'attesa dei fotogrammi dal thread di lettura
+            t, wait = time.perf_counter(), tempi["wait"]
+            frame = next(filtered, None)
+            if frame is None:
+                break
+            if pipeline is not None:
+                frame = pipeline.run(frame)
+            tempi["filter"] += time.perf_counter() - t - (tempi["wait"] - wait)
+            if not _put(pending, (frame, output_paths[done]), stop):
+                break
+            done += 1
+            if progress is not None:
+                progress(done, len(paths))
+        _put(pending, _END, stop)
+        writer.join()
+    finally:
+        # In caso di errore (o a fine corsa) i thread si fermano
+        stop.set()
+        writer.join()
+        reader.join()
+    if errori:
+        raise errori[0]
+
+    seconds = time.perf_counter() - start
+    return {"frames": done, "seconds": round(seconds, 3), "fps": round(done / seconds, 2) if seconds > 0 else None,
+            **{f"{fase}_seconds": round(tempi[fase], 3) for fase in ("read", "filter", "write")}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Filtra una sequenza di fotogrammi numerati (es. frame_0001.png) con un filtro temporale "
+                    "e una catena di filtri spaziali, a flusso continuo.",
+    )
+    parser.add_argument("inputs", nargs="+", help="cartelle, file o pattern glob dei fotogrammi")
+    parser.add_argument("-o", "--output-dir", required=True, help="cartella di destinazione")
+    parser.add_argument("--temporal", choices=TEMPORAL_MODES, default="median", help="filtro temporale (default: median)")
+    parser.add_argument("--window", type=int, default=3,
+                        help="fotogrammi della finestra temporale, dispari (default: 3; 1 = nessun filtro temporale)")
+    parser.add_argument("-f", "--filtro", action="append", default=[],
+                        help='filtro spaziale da applicare a ogni fotogramma, ripetibile: "Filtro Mediano:kernel_size=3"')
+    parser.add_argument("--chain", help="pipeline spaziale salvata in JSON o YAML (in alternativa a --filtro)")
+    parser.add_argument("--ext", help="estensione dei file di uscita (default: la stessa dell'ingresso)")
+    parser.add_argument("--queue", type=int, default=QUEUE_FRAMES, help=f"fotogrammi in coda (default: {QUEUE_FRAMES})")
+    args = parser.parse_args(argv)
+
+    try:
+        pipeline = Pipeline.load(args.chain) if args.chain else Pipeline.from_filtri(parse_filtro(s) for s in args.filtro)
+    except (ValueError, KeyError, ImportError) as exc:
+        parser.error(str(exc))
+    paths = find_frames(args.inputs)
+    if not paths:
+        parser.error("nessun fotogramma trovato")
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_paths = [output_path_for(p, args.output_dir, args.ext) for p in paths]
+    if len(set(output_paths)) != len(output_paths):
+        parser.error("più fotogrammi finirebbero nello stesso file di uscita")
+
+    def progress(done, total):
+        if done % 50 == 0 or done == total:
+            print(f"{done}/{total} fotogrammi", file=sys.stderr)
+
+    try:
+        report = process_sequence(paths, output_paths, pipeline if len(pipeline) else None, args.window,
+                                  args.temporal, args.queue, progress)
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(f"{report['frames']} fotogrammi in {report['seconds']:.2f} s ({report['fps']} fotogrammi/s; "
+          f"lettura {report['read_seconds']:.2f} s, filtri {report['filter_seconds']:.2f} s, "
+          f"scrittura {report['write_seconds']:.2f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
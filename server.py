@@ -0,0 +1,448 @@
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from multiprocessing import resource_tracker, shared_memory
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from PIL import Image
+
+from cli import parse_filtro
+from pipeline import Pipeline
+
+
+# Richieste accettate e non ancora partite oltre cui si risponde 503
+QUEUE_SIZE = 64
+
+# Immagini piccole (in pixel) con la stessa catena vengono filtrate insieme,
+# fino a BATCH_MAX_IMAGES per volta, aspettando al più BATCH_WAIT secondi
+BATCH_PIXELS = 512 * 512
+BATCH_MAX_IMAGES = 16
+BATCH_WAIT = 0.002
+
+MAX_BODY_BYTES = 64 * 2**20
+
+# Latenze tenute per i percentili di /stats
+LATENCY_SAMPLES = 4096
+
+# Modi di PIL filtrati così come sono (uint8 da 1 a 4 canali, interi a 16/32
+# bit) e modi convertiti prima di filtrare; gli altri (es. F, LAB) → 400
+IMAGE_MODES = ("L", "LA", "RGB", "RGBA", "I;16", "I")
+_CONVERT_MODES = {"1": "L", "P": "RGB", "PA": "RGBA", "CMYK": "RGB", "YCbCr": "RGB"}
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+@lru_cache(maxsize=32)
+def _pipeline(stages_json):
+    # Nei worker la catena (già controllata dal server) viene costruita una volta sola
+    return Pipeline.from_dict(json.loads(stages_json))
+
+
+def _warm():
+    # Primo uso della catena nel worker: NumPy e i filtri sono pronti per le richieste
+    _pipeline(json.dumps([{"name": "Filtro Mediano", "params": {}}])).run(np.zeros((8, 8), dtype=np.uint8))
+    return os.getpid()
+
+
+def run_batch(stages_json, jobs):
+    """
+    Eseguita nei worker: filtra ogni immagine (nome del blocco di memoria
+    condivisa, forma, tipo) sul posto, senza copiare i pixel tra i processi.
+    Restituisce per ogni immagine None oppure il messaggio d'errore.
+    """
+    pipeline = _pipeline(stages_json)
+    errors = []
+    for name, shape, dtype in jobs:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            image[:] = pipeline.run(image)
+            errors.append(None)
+        except Exception as exc:  # un'immagine sbagliata non deve far fallire il gruppo
+            errors.append(f"{type(exc).__name__}: {exc}")
+        finally:
+            image = None
+            shm.close()
+    return errors
+
+
+def _decode(data):
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as exc:
+        raise HttpError(400, f"Immagine non leggibile: {exc}")
+    with image:
+        if image.mode == "P" and "transparency" in image.info:
+            return np.array(image.convert("RGBA"))
+        if image.mode in _CONVERT_MODES:
+            return np.array(image.convert(_CONVERT_MODES[image.mode]))
+        if image.mode not in IMAGE_MODES:
+            raise HttpError(400, f"Modo immagine non supportato: {image.mode} "
+                                 f"(ammessi: {', '.join(IMAGE_MODES + tuple(_CONVERT_MODES))})")
+        return np.array(image)
+
+
+def _encode(image):
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _parse_chain(query):
+    """
+    Pipeline della richiesta: parametri filtro ripetuti (sintassi di cli.py,
+    "Filtro Mediano:kernel_size=3") oppure chain con il JSON di una pipeline.
+    """
+    params = parse_qs(query)
+    try:
+        if "chain" in params:
+            pipeline = Pipeline.from_json(params["chain"][0])
+        else:
+            pipeline = Pipeline.from_filtri(parse_filtro(s) for s in params.get("filtro", []))
+    except (ValueError, KeyError, TypeError) as exc:
+        raise HttpError(400, f"Catena non valida: {exc}")
+    if not len(pipeline):
+        raise HttpError(400, "Specificare almeno un filtro (filtro=...) o una pipeline (chain=...)")
+    return pipeline
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    p50, p90, p99 = np.percentile(np.array(values) * 1000, [50, 90, 99])
+    return {"p50_ms": round(p50, 2), "p90_ms": round(p90, 2), "p99_ms": round(p99, 2), "samples": len(values)}
+
+
+class _Job:
+    def __init__(self, key, image, shm, future):
+        self.key = key
+        self.shape = image.shape
+        self.dtype = image.dtype
+        self.pixels = image.shape[0] * image.shape[1]
+        self.shm = shm
+        self.future = future
+        self.queued = time.perf_counter()
+        self.started = None
+        self.batch_size = 1
+
+
+class FilterService:
+    """
+    Servizio HTTP che applica le catene di FILTRI alle immagini ricevute:
+    - POST /filter?filtro=...&filtro=... (o ?chain=<JSON>) con l'immagine nel
+      corpo: risponde con il PNG filtrato
+    - GET /stats: richieste, rifiutate, gruppi e percentili di latenza
+      (totale, attesa in coda, filtri) in JSON
+    - GET /health
+    I filtri girano in un pool di processi avviato e scaldato all'inizio; i
+    pixel passano ai worker in memoria condivisa. Le immagini piccole con la
+    stessa catena in attesa vengono filtrate in un solo compito; con più di
+    queue_size richieste in attesa si risponde 503 (Retry-After), così la
+    memoria resta limitata anche sotto carico.
+    """
+
+    def __init__(self, workers=None, queue_size=QUEUE_SIZE, batch_wait=BATCH_WAIT):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.batch_wait = batch_wait
+        self.pool = None
+        self.waiting = deque()
+        self.pending = 0
+        self.running = set()
+        self.counts = {"requests": 0, "ok": 0, "rejected": 0, "errors": 0, "batches": 0, "batched_images": 0,
+                       "pool_restarts": 0}
+        self.latency = {name: deque(maxlen=LATENCY_SAMPLES) for name in ("total", "queue", "process")}
+
+    async def start(self):
+        await self._start_pool()
+        self.arrived = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.workers)
+        self.dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self):
+        self.dispatcher.cancel()
+        self.pool.shutdown(cancel_futures=True)
+
+    async def _start_pool(self):
+        loop = asyncio.get_running_loop()
+        context = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else None
+        # I worker ereditano il resource tracker: i blocchi di memoria condivisa
+        # che aprono risultano liberati quando il server li elimina
+        resource_tracker.ensure_running()
+        self.pool = pool = ProcessPoolExecutor(self.workers, mp_context=context)
+        # Un compito per worker: i processi partono ora e non alla prima richiesta
+        await asyncio.gather(*(loop.run_in_executor(pool, _warm) for _ in range(self.workers)))
+
+    async def _restart_pool(self, broken):
+        # Un worker morto (es. ucciso per memoria) rompe tutto il pool: se ne
+        # avvia uno nuovo, una volta sola anche se più gruppi hanno fallito
+        if self.pool is not broken:
+            return
+        self.counts["pool_restarts"] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        await self._start_pool()
+
+    # Coda e gruppi
+
+    def _take_batch(self):
+        first = self.waiting.popleft()
+        batch = [first]
+        if first.pixels <= BATCH_PIXELS:
+            rimasti = deque()
+            while self.waiting and len(batch) < BATCH_MAX_IMAGES:
+                job = self.waiting.popleft()
+                (batch if job.key == first.key and job.pixels <= BATCH_PIXELS else rimasti).append(job)
+            self.waiting.extendleft(reversed(rimasti))
+        return batch
+
+    async def _dispatch(self):
+        # Un gruppo per worker libero: le richieste in più aspettano nella coda
+        while True:
+            await self.slots.acquire()
+            while not self.waiting:
+                self.arrived.clear()
+                await self.arrived.wait()
+            first = self.waiting[0]
+            if self.batch_wait and first.pixels <= BATCH_PIXELS and len(self.waiting) < BATCH_MAX_IMAGES:
+                await asyncio.sleep(self.batch_wait)
+            if not self.waiting:
+                # Richieste annullate durante l'attesa
+                self.slots.release()
+                continue
+            batch = self._take_batch()
+            self.pending -= len(batch)
+            task = asyncio.create_task(self._run(batch))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        for job in batch:
+            job.started, job.batch_size = started, len(batch)
+        self.counts["batches"] += 1
+        self.counts["batched_images"] += len(batch)
+        pool = self.pool
+        try:
+            jobs = [(job.shm.name, job.shape, job.dtype.str) for job in batch]
+            errors = await loop.run_in_executor(pool, run_batch, batch[0].key, jobs)
+            for job, error in zip(batch, errors):
+                job.future.set_result(error)
+        except BrokenProcessPool:
+            # Falliscono solo le richieste di questo gruppo; le prossime usano il nuovo pool
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(HttpError(500, "Worker terminato durante l'elaborazione, riprovare"))
+            await self._restart_pool(pool)
+        except Exception as exc:
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(exc)
+        finally:
+            self.slots.release()
+
+    async def filter_image(self, pipeline, data):
+        """
+        Filtra un'immagine codificata (PNG, JPEG...) e restituisce il PNG
+        filtrato e le informazioni sulla richiesta.
+        """
+        if self.pending >= self.queue_size:
+            self.counts["rejected"] += 1
+            raise HttpError(503, "Coda piena, riprovare più tardi")
+        self.pending += 1
+        arrival = time.perf_counter()
+        shm = None
+        try:
+            image = await asyncio.to_thread(_decode, data)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+            np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[:] = image
+            key = json.dumps(pipeline.to_dict()["stages"], sort_keys=True)
+            job = _Job(key, image, shm, asyncio.get_running_loop().create_future())
+            self.waiting.append(job)
+            self.arrived.set()
+        except BaseException:
+            self.pending -= 1
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            raise
+
+        try:
+            error = await job.future
+            if error is not None:
+                raise HttpError(500, error)
+            result = np.ndarray(job.shape, dtype=job.dtype, buffer=shm.buf).copy()
+        finally:
+            if job in self.waiting:
+                # Richiesta annullata prima di partire
+                self.waiting.remove(job)
+                self.pending -= 1
+            # Un worker che la sta ancora usando tiene valida la sua mappatura
+            shm.close()
+            shm.unlink()
+        done = time.perf_counter()
+        body = await asyncio.to_thread(_encode, result)
+
+        total = time.perf_counter() - arrival
+        self.latency["total"].append(total)
+        self.latency["queue"].append(job.started - job.queued)
+        self.latency["process"].append(done - job.started)
+        info = {"queue_ms": round((job.started - job.queued) * 1000, 2),
+                "process_ms": round((done - job.started) * 1000, 2), "batch_size": job.batch_size}
+        return body, info
+
+    def stats(self):
+        return {
+            **self.counts,
+            "workers": self.workers,
+            "waiting": len(self.waiting),
+            "queue_size": self.queue_size,
+            "mean_batch_size": round(self.counts["batched_images"] / self.counts["batches"], 2)
+            if self.counts["batches"] else None,
+            "latency": {name: _percentiles(values) for name, values in self.latency.items()},
+        }
+
+    # HTTP
+
+    async def handle(self, reader, writer):
+        """
+        Connessione HTTP/1.1 (keep-alive se il client non chiede di chiudere).
+        """
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except HttpError as exc:
+                    writer.write(_response(exc.status, _json_body({"error": str(exc)}), "application/json", close=True))
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                close = headers.get("connection", "").lower() == "close"
+                status, payload, content_type, extra = await self._route(method, target, body)
+                writer.write(_response(status, payload, content_type, extra, close))
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, target, body):
+        url = urlsplit(target)
+        self.counts["requests"] += 1
+        try:
+            if url.path == "/health":
+                return 200, b"ok", "text/plain", {}
+            if url.path == "/stats":
+                return 200, _json_body(self.stats()), "application/json", {}
+            if url.path != "/filter":
+                raise HttpError(404, f"Percorso sconosciuto: {url.path}")
+            if method != "POST":
+                raise HttpError(405, "Usare POST con l'immagine nel corpo")
+            png, info = await self.filter_image(_parse_chain(url.query), body)
+            self.counts["ok"] += 1
+            extra = {"X-Queue-Ms": info["queue_ms"], "X-Process-Ms": info["process_ms"], "X-Batch-Size": info["batch_size"]}
+            return 200, png, "image/png", extra
+        except HttpError as exc:
+            if exc.status != 503:
+                self.counts["errors"] += 1
+            extra = {"Retry-After": 1} if exc.status == 503 else {}
+            return exc.status, _json_body({"error": str(exc)}), "application/json", extra
+        except Exception as exc:
+            self.counts["errors"] += 1
+            return 500, _json_body({"error": f"{type(exc).__name__}: {exc}"}), "application/json", {}
+
+
+async def _read_request(reader):
+    # (metodo, destinazione, intestazioni, corpo), None se il client ha chiuso
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Riga di richiesta non valida")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0) or 0)
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, f"Corpo oltre {MAX_BODY_BYTES} byte")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+def _json_body(data):
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def _response(status, body, content_type, extra=None, close=False):
+    headers = {"Content-Type": content_type, "Content-Length": len(body),
+               "Connection": "close" if close else "keep-alive", **(extra or {})}
+    head = f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+    return head.encode("latin-1") + b"\r\n" + body
+
+
+async def serve(host="127.0.0.1", port=8000, workers=None, queue_size=QUEUE_SIZE, ready=None):
+    """
+    Avvia il servizio e resta in ascolto finché non viene annullato;
+    ready(host, port) viene chiamata quando accetta connessioni (con port=0
+    riceve la porta scelta dal sistema).
+    """
+    service = FilterService(workers, queue_size)
+    await service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    try:
+        if ready is not None:
+            ready(*server.sockets[0].getsockname()[:2])
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servizio HTTP locale che applica le catene di filtri alle immagini.")
+    parser.add_argument("--host", default="127.0.0.1", help="indirizzo di ascolto (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="porta (default: 8000)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processi del pool (default: numero di core)")
+    parser.add_argument("--queue", type=int, default=QUEUE_SIZE,
+                        help=f"richieste in attesa oltre cui si risponde 503 (default: {QUEUE_SIZE})")
+    args = parser.parse_args(argv)
+
+    def ready(host, port):
+        print(f"In ascolto su http://{host}:{port} (POST /filter, GET /stats)", file=sys.stderr)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue, ready))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,514 @@
+import io
+import os
+import struct
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from tiling import TiffStripWriter, chain_radius, filter_region
+
+
+# Strisce decodificate tenute in memoria da un lettore (per i bordi delle bande)
+CACHED_STRIPS = 8
+
+# Righe decodificate per volta dai PNG
+PNG_ROWS_PER_READ = 64
+
+
+class StripReader:
+    """
+    Immagine letta a strisce di righe solo quando servono: si comporta come un
+    array in sola lettura per le fette di righe (image[y0:y1], image[y0:y1, x0:x1])
+    e ha shape, dtype e ndim. Le sottoclassi implementano read_rows(y0, y1).
+    """
+
+    shape = ()
+    dtype = np.dtype(np.uint8)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def read_rows(self, y0, y1):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        rows, rest = key[0], key[1:]
+        if not isinstance(rows, slice) or rows.step not in (None, 1):
+            raise IndexError("Sono supportate solo fette di righe contigue")
+        y0, y1, _ = rows.indices(self.shape[0])
+        return self.read_rows(y0, max(y0, y1))[(slice(None),) + rest]
+
+    def __array__(self, dtype=None, copy=None):
+        image = self.read_rows(0, self.shape[0])
+        return image if dtype is None else image.astype(dtype)
+
+
+# PNG
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+# Canali per tipo di colore PNG (scala di grigi, RGB, palette, grigi + alfa, RGBA)
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+class PngStripReader(StripReader):
+    """
+    Legge un PNG a 8 bit non interlacciato a blocchi di righe, decomprimendo
+    i dati IDAT man mano. Il filtraggio delle righe viene annullato da PIL:
+    ogni blocco diventa un piccolo PNG preceduto dall'ultima riga già
+    decodificata (con filtro 0), da cui dipendono i filtri Up/Average/Paeth.
+    Le righe vanno lette in ordine crescente (con un po' di sovrapposizione
+    per i bordi); tornare più indietro fa ripartire la decodifica dall'inizio.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        if self.file.read(8) != b"\x89PNG\r\n\x1a\n":
+            raise ValueError(f"{path} non è un PNG")
+        self.idat = []
+        self.extra_chunks = b""
+        while True:
+            length, kind = struct.unpack(">I4s", self.file.read(8))
+            if kind == b"IHDR":
+                self.header = self.file.read(length)
+                self.file.seek(4, os.SEEK_CUR)
+            elif kind == b"IDAT":
+                self.idat.append((self.file.tell(), length))
+                self.file.seek(length + 4, os.SEEK_CUR)
+            elif kind in (b"PLTE", b"tRNS"):
+                # Servono a PIL per decidere il modo (P, trasparenza) come per il file intero
+                data = self.file.read(length)
+                self.file.seek(4, os.SEEK_CUR)
+                self.extra_chunks += _png_chunk(kind, data)
+            elif kind == b"IEND":
+                break
+            else:
+                self.file.seek(length + 4, os.SEEK_CUR)
+
+        width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", self.header)
+        if bit_depth != 8 or interlace or color_type not in _PNG_CHANNELS:
+            self.file.close()
+            raise ValueError("Lettura a strisce solo per PNG a 8 bit non interlacciati")
+        self.width, self.height, self.color_type = width, height, color_type
+        self.channels = _PNG_CHANNELS[color_type]
+        self.row_bytes = width * self.channels
+        self.shape = (height, width) if self.channels == 1 else (height, width, self.channels)
+        self._restart()
+
+    def _restart(self):
+        self._decompressor = zlib.decompressobj()
+        self._chunks = iter(self.idat)
+        self._tail = b""
+        self._pending = b""
+        self._previous = bytes(self.row_bytes)
+        self._rows = np.empty((0,) + self.shape[1:], dtype=np.uint8)
+        self._start = 0  # indice della prima riga in self._rows
+
+    def _raw_rows(self, n):
+        # n righe filtrate (byte del filtro + dati), dallo stream zlib
+        need = n * (self.row_bytes + 1)
+        parts, have = [self._pending], len(self._pending)
+        while have < need:
+            if not self._tail:
+                offset, length = next(self._chunks)
+                self.file.seek(offset)
+                self._tail = self.file.read(length)
+            data = self._decompressor.decompress(self._tail, need - have)
+            self._tail = self._decompressor.unconsumed_tail
+            parts.append(data)
+            have += len(data)
+        raw = b"".join(parts)
+        self._pending = raw[need:]
+        return raw[:need]
+
+    def _decode_next(self, n):
+        raw = self._raw_rows(n)
+        header = struct.pack(">IIBBBBB", self.width, n + 1, 8, self.color_type, 0, 0, 0)
+        data = zlib.compress(b"\x00" + self._previous + raw, 0)
+        png = (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header) + self.extra_chunks
+               + _png_chunk(b"IDAT", data) + _png_chunk(b"IEND", b""))
+        rows = np.array(Image.open(io.BytesIO(png)))[1:]
+        self._previous = rows[-1].tobytes()
+        return rows
+
+    def read_rows(self, y0, y1):
+        if y0 < self._start:
+            self._restart()
+        # Righe già decodificate [start, end), poi si decodifica fino a y1
+        start, end = self._start, self._start + len(self._rows)
+        parts = [self._rows]
+        if end <= y0:
+            parts, start = [], end
+        while end < y1:
+            n = min(max(PNG_ROWS_PER_READ, y1 - end), self.height - end)
+            rows = self._decode_next(n)
+            end += n
+            if end <= y0:
+                start = end  # righe saltate: non servono
+                continue
+            parts.append(rows)
+        rows = np.concatenate(parts) if len(parts) > 1 else (parts[0] if parts else self._rows[:0])
+        # Le righe prima di y0 non servono più
+        drop = max(0, y0 - start)
+        self._rows, self._start = rows[drop:], start + drop
+        return self._rows[y0 - self._start:y1 - self._start]
+
+    def close(self):
+        self.file.close()
+
+
+# TIFF
+
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+_TIFF_TYPE_FORMATS = {1: "B", 3: "H", 4: "I", 6: "b", 8: "h", 9: "i"}
+
+# Tag copiati nei TIFF di una sola striscia usati per decodificare le strisce compresse
+_TIFF_STRIP_TAGS = (256, 258, 259, 262, 266, 277, 284, 317, 320, 338, 339, 347, 529, 530, 531, 532)
+
+
+def _tiff_ifd(f):
+    """
+    Legge la prima IFD di un TIFF classico: (byte order, {tag: (tipo, count, byte dei valori)}).
+    """
+    f.seek(0)
+    order = {b"II": "<", b"MM": ">"}.get(f.read(2))
+    if order is None or struct.unpack(order + "H", f.read(2))[0] != 42:
+        raise ValueError("Non è un TIFF classico")
+    f.seek(struct.unpack(order + "I", f.read(4))[0])
+    entries = {}
+    for _ in range(struct.unpack(order + "H", f.read(2))[0]):
+        tag, kind, count, value = struct.unpack(order + "HHI4s", f.read(12))
+        size = _TIFF_TYPE_SIZES.get(kind, 1) * count
+        if size > 4:
+            position = f.tell()
+            f.seek(struct.unpack(order + "I", value)[0])
+            value = f.read(size)
+            f.seek(position)
+        entries[tag] = (kind, count, value[:size])
+    return order, entries
+
+
+def _tiff_values(order, entries, tag, default=None):
+    if tag not in entries:
+        return default
+    kind, count, data = entries[tag]
+    return list(struct.unpack(order + _TIFF_TYPE_FORMATS[kind] * count, data))
+
+
+def _tiff_bytes(order, entries, strip):
+    """
+    TIFF con i tag dati e una sola striscia di dati.
+    """
+    entries = dict(entries)
+    entries[273] = (4, 1, struct.pack(order + "I", 8))
+    entries[279] = (4, 1, struct.pack(order + "I", len(strip)))
+    ifd_offset = 8 + len(strip) + len(strip) % 2
+    extra_offset = ifd_offset + 2 + 12 * len(entries) + 4
+    ifd, extra = b"", b""
+    for tag in sorted(entries):
+        kind, count, data = entries[tag]
+        if len(data) <= 4:
+            ifd += struct.pack(order + "HHI", tag, kind, count) + data.ljust(4, b"\0")
+        else:
+            ifd += struct.pack(order + "HHII", tag, kind, count, extra_offset + len(extra))
+            extra += data + b"\0" * (len(data) % 2)
+    header = (b"II" if order == "<" else b"MM") + struct.pack(order + "HI", 42, ifd_offset)
+    return (header + strip + b"\0" * (len(strip) % 2)
+            + struct.pack(order + "H", len(entries)) + ifd + struct.pack(order + "I", 0) + extra)
+
+
+class TiffStripReader(StripReader):
+    """
+    Legge un TIFF a strisce una striscia alla volta. Le strisce non compresse
+    vengono lette così come sono; quelle compresse (LZW, Deflate, PackBits...)
+    vengono decodificate da PIL come un TIFF di una sola striscia.
+    Tiene in memoria le ultime CACHED_STRIPS strisce.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            order, entries = _tiff_ifd(self.file)
+        except Exception:
+            self.file.close()
+            raise
+        if 322 in entries or 273 not in entries:
+            self.file.close()
+            raise ValueError("Lettura a strisce solo per TIFF organizzati a strisce")
+
+        self.order, self.entries = order, entries
+        width = _tiff_values(order, entries, 256)[0]
+        height = _tiff_values(order, entries, 257)[0]
+        channels = _tiff_values(order, entries, 277, [1])[0]
+        self.rows_per_strip = min(_tiff_values(order, entries, 278, [height])[0], height)
+        self.offsets = _tiff_values(order, entries, 273)
+        self.counts = _tiff_values(order, entries, 279)
+        self.compression = _tiff_values(order, entries, 259, [1])[0]
+        self.photometric = _tiff_values(order, entries, 262, [1])[0]
+        bits = set(_tiff_values(order, entries, 258, [1]))
+        planar = _tiff_values(order, entries, 284, [1])[0]
+        if bits != {8} or (planar != 1 and channels > 1):
+            self.file.close()
+            raise ValueError("Lettura a strisce solo per TIFF a 8 bit con campioni interlacciati")
+
+        self.width, self.height, self.channels = width, height, channels
+        self.shape = (height, width) if channels == 1 else (height, width, channels)
+        self._strips = OrderedDict()
+
+    @property
+    def raw(self):
+        """
+        True se i pixel sono memorizzati così come sono (niente compressione,
+        predittore o inversione dei grigi): si possono mappare in memoria.
+        """
+        predictor = _tiff_values(self.order, self.entries, 317, [1])[0]
+        return self.compression == 1 and predictor == 1 and self.photometric in (1, 2)
+
+    def contiguous(self):
+        return all(self.offsets[i] + self.counts[i] == self.offsets[i + 1] for i in range(len(self.offsets) - 1))
+
+    def _strip(self, s):
+        if s in self._strips:
+            self._strips.move_to_end(s)
+            return self._strips[s]
+        rows = min(self.rows_per_strip, self.height - s * self.rows_per_strip)
+        self.file.seek(self.offsets[s])
+        data = self.file.read(self.counts[s])
+        if self.raw:
+            strip = np.frombuffer(data, dtype=np.uint8, count=rows * self.width * self.channels).reshape((rows,) + self.shape[1:])
+        else:
+            entries = {tag: self.entries[tag] for tag in _TIFF_STRIP_TAGS if tag in self.entries}
+            entries[257] = (4, 1, struct.pack(self.order + "I", rows))
+            entries[278] = (4, 1, struct.pack(self.order + "I", rows))
+            strip = np.array(Image.open(io.BytesIO(_tiff_bytes(self.order, entries, data))))
+        self._strips[s] = strip
+        if len(self._strips) > CACHED_STRIPS:
+            self._strips.popitem(last=False)
+        return strip
+
+    def read_rows(self, y0, y1):
+        if y1 <= y0:
+            return np.empty((0,) + self.shape[1:], dtype=np.uint8)
+        first, last = y0 // self.rows_per_strip, (y1 - 1) // self.rows_per_strip
+        rows = np.concatenate([self._strip(s) for s in range(first, last + 1)])
+        start = first * self.rows_per_strip
+        return rows[y0 - start:y1 - start]
+
+    def close(self):
+        self.file.close()
+
+
+def open_image(path, shape=None, dtype=np.uint8):
+    """
+    Apre un'immagine senza decodificarla tutta, quando il formato lo permette:
+    - .npy: np.load con mmap_mode='r'
+    - .raw/.bin: np.memmap in sola lettura (servono shape e dtype)
+    - TIFF non compresso con strisce contigue: np.memmap dei pixel
+    - altri TIFF a strisce e PNG a 8 bit: lettori che decodificano solo le
+      strisce richieste (TiffStripReader, PngStripReader)
+    - altrimenti l'immagine viene decodificata per intero con load_image
+    Il risultato si legge a fette di righe come un array.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return np.load(path, mmap_mode="r")
+    if extension in (".raw", ".bin"):
+        if shape is None:
+            raise ValueError("Per i file raw servono shape e dtype")
+        return np.memmap(path, dtype=dtype, mode="r", shape=tuple(shape))
+    try:
+        if extension in (".tif", ".tiff"):
+            reader = TiffStripReader(path)
+            if reader.raw and reader.contiguous():
+                reader.close()
+                return np.memmap(path, dtype=np.uint8, mode="r", offset=reader.offsets[0], shape=reader.shape)
+            return reader
+        if extension == ".png":
+            return PngStripReader(path)
+    except (ValueError, struct.error):
+        pass  # varianti non gestite a strisce: decodifica completa
+    from utils import load_image
+    return load_image(path)
+
+
+# Scrittura a strisce
+
+class PngStripWriter:
+    """
+    Scrive un PNG a 8 bit (1, 2, 3 o 4 canali) comprimendo le righe man mano
+    che arrivano: in memoria restano solo la striscia corrente e l'ultima riga
+    (per il filtro Up, che spesso comprime meglio delle righe così come sono).
+    """
+
+    def __init__(self, path, width, height, channels=1, level=6):
+        color_types = {1: 0, 2: 4, 3: 2, 4: 6}
+        if channels not in color_types:
+            raise ValueError("Sono supportate immagini da 1 a 4 canali")
+        self.path = path
+        self.width, self.height, self.channels = width, height, channels
+        self.rows_written = 0
+        self.previous = np.zeros(width * channels, dtype=np.uint8)
+        self.compressor = zlib.compressobj(level)
+        self.file = open(path, "wb")
+        header = struct.pack(">IIBBBBB", width, height, 8, color_types[channels], 0, 0, 0)
+        self.file.write(b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header))
+
+    def write_rows(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(len(rows), -1)
+        if rows.shape[1] != self.width * self.channels:
+            raise ValueError("Forma delle righe non compatibile con l'immagine")
+        filtered = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 2  # filtro Up: differenza con la riga sopra (modulo 256)
+        np.subtract(rows, np.vstack([self.previous, rows[:-1]]), out=filtered[:, 1:])
+        data = self.compressor.compress(filtered.tobytes())
+        if data:
+            self.file.write(_png_chunk(b"IDAT", data))
+        self.previous = rows[-1].copy()
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.rows_written != self.height:
+            self.file.close()
+            raise ValueError(f"Scritte {self.rows_written} righe su {self.height}")
+        self.file.write(_png_chunk(b"IDAT", self.compressor.flush()) + _png_chunk(b"IEND", b""))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+
+class ArrayStripWriter:
+    """
+    Scrittura a strisce in un array: un .npy mappato in memoria (path .npy),
+    oppure un array in memoria salvato con save_image alla chiusura, per i
+    formati che PIL non sa scrivere a pezzi (es. JPEG).
+    """
+
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        if path.lower().endswith(".npy"):
+            self.array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        else:
+            self.array = np.empty(shape, dtype=dtype)
+        self.rows_written = 0
+
+    def write_rows(self, rows):
+        self.array[self.rows_written:self.rows_written + len(rows)] = rows
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self.rows_written != len(self.array):
+            raise ValueError(f"Scritte {self.rows_written} righe su {len(self.array)}")
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
+        else:
+            from utils import save_image
+            save_image(self.array, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def open_writer(path, shape, dtype):
+    """
+    Scrittore a strisce adatto all'estensione di `path` (oggetto con
+    write_rows(rows) e close(), usabile con with):
+    - .tif/.tiff → TiffStripWriter, .png → PngStripWriter (solo uint8)
+    - .npy → np.memmap, .raw/.bin → byte grezzi scritti in sequenza
+    - altri formati → array in memoria salvato alla chiusura
+    """
+    height, width = shape[:2]
+    channels = shape[2] if len(shape) == 3 else 1
+    extension = os.path.splitext(path)[1].lower()
+    if np.dtype(dtype) == np.uint8 and extension in (".tif", ".tiff"):
+        return TiffStripWriter(path, width, height, channels)
+    if np.dtype(dtype) == np.uint8 and extension == ".png":
+        return PngStripWriter(path, width, height, channels)
+    if extension in (".raw", ".bin"):
+        return RawStripWriter(path)
+    return ArrayStripWriter(path, shape, dtype)
+
+
+class RawStripWriter:
+    """
+    Byte dei pixel scritti in sequenza, senza intestazione (da rileggere con
+    open_image(path, shape, dtype)).
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+
+    def write_rows(self, rows):
+        self.file.write(np.ascontiguousarray(rows).tobytes())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def stream_file(input_path, pipeline, output_path, strip_rows=256, shape=None, dtype=np.uint8):
+    """
+    Carica → filtra → salva a strisce di righe: ogni striscia viene letta con
+    il bordo necessario alla catena (come in tiling.process_tiled), filtrata
+    con pipeline.run (catena fusa, stesso risultato del file intero) e
+    scritta subito, quindi in memoria restano poche strisce alla volta se il
+    formato di ingresso si legge a strisce (vedi open_image). shape e dtype
+    servono solo per gli ingressi raw. Le strisce vanno in un file
+    temporaneo accanto a output_path, che lo sostituisce solo a lavoro
+    finito: un errore non lascia un'uscita troncata.
+    """
+    directory, nome = os.path.split(output_path)
+    root, extension = os.path.splitext(nome)
+    # Stessa estensione: open_writer e save_image scelgono il formato da quella
+    temporary = os.path.join(directory, f".{root}.{os.getpid()}.tmp{extension}")
+    source = open_image(input_path, shape, dtype)
+    height, width = source.shape[:2]
+    filtri = pipeline.filtri
+    halo = chain_radius(filtri)
+    writer = None
+    try:
+        for y0 in range(0, height, strip_rows):
+            y1 = min(y0 + strip_rows, height)
+            band = filter_region(source, filtri, y0, y1, 0, width, halo, run=pipeline.run)
+            if writer is None:
+                writer = open_writer(temporary, (height, width) + band.shape[2:], band.dtype)
+            writer.write_rows(band)
+        if writer is not None:
+            writer.close()
+            os.replace(temporary, output_path)
+    except BaseException:
+        if writer is not None and hasattr(writer, "file"):
+            writer.file.close()
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    finally:
+        if hasattr(source, "close"):
+            source.close()
+    return output_path
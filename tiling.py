@@ -0,0 +1,285 @@
+import os
+import struct
+
+import numpy as np
+
+from catalog import full_params
+from filters import apply_filter_to_channels, closing_filter, opening_filter
+from utils import load_image, save_image
+
+
+# Filtri composti da più passate con la stessa finestra: il raggio si moltiplica
+_PASSES = {opening_filter: 2, closing_filter: 2}
+
+# Raggio (nella scala del livello) del kernel binomiale con cui la piramide
+# scende e risale
+_PYRAMID_RADIUS = 3
+
+
+def filter_radius(func, params):
+    """
+    Raggio (in pixel) di cui un filtro ha bisogno attorno a ogni pixel:
+    kernel_size // 2, oppure max_kernel_size // 2 per il mediano adattivo e
+    search_size // 2 + patch_size // 2 per il non-local means, moltiplicato
+    per il numero di passate dei filtri composti. Per i filtri piramidali
+    (filters.pyramid) il raggio del filtro di base più il kernel della
+    piramide, moltiplicati per 2**levels.
+    I parametri mancanti prendono il valore di default della funzione; con
+    channel_params vale il raggio più grande tra quelli dei canali.
+    """
+    overrides = [o for o in (params.get("channel_params") or {}).values() if o is not None]
+    if overrides:
+        base = {k: v for k, v in params.items() if k != "channel_params"}
+        return max([filter_radius(func, base)] + [filter_radius(func, {**base, **o}) for o in overrides])
+    values = full_params(func, params)
+    base = getattr(func, "pyramid_of", None)
+    if base is not None:
+        levels = values.pop("levels")
+        overrides = [o for o in (values.pop("level_params") or {}).values() if o is not None]
+        radius = max([filter_radius(base, values)] + [filter_radius(base, {**values, **o}) for o in overrides])
+        return 2 ** levels * (radius + _PYRAMID_RADIUS)
+    if "max_kernel_size" in values:
+        return values["max_kernel_size"] // 2
+    if "search_size" in values:
+        return values["search_size"] // 2 + values["patch_size"] // 2
+    return _PASSES.get(func, 1) * (values.get("kernel_size", 1) // 2)
+
+
+def chain_radius(filtri):
+    """
+    Bordo (halo) necessario per una catena di filtri [(nome, func, params), ...]:
+    ogni filtro consuma il proprio raggio, quindi i raggi si sommano.
+    """
+    return sum(filter_radius(func, params) for _, func, params in filtri)
+
+
+def chain_alignment(filtri):
+    """
+    Multiplo a cui va allineato l'angolo di un tassello (con il bordo) perché
+    i filtri piramidali campionino gli stessi pixel dell'immagine intera:
+    2**levels del filtro piramidale più profondo, 1 senza piramidi.
+    """
+    return max([1] + [2 ** full_params(func, params)["levels"]
+                      for _, func, params in filtri if getattr(func, "pyramid_of", None) is not None])
+
+
+def tile_exact(filtri):
+    """
+    True se la catena a tasselli dà esattamente il risultato sull'immagine
+    intera; non vale per il bilaterale approssimato (tolerance), la cui
+    griglia dipende dall'intera immagine.
+    """
+    return all(full_params(func, params).get("tolerance") is None for _, func, params in filtri)
+
+
+def apply_chain(image, filtri):
+    """
+    Applica in ordine i filtri [(nome, func, params), ...] all'immagine.
+    """
+    for _, func, params in filtri:
+        image = apply_filter_to_channels(image, func, **params)
+    return image
+
+
+def iter_tiles(height, width, tile_size):
+    """
+    Genera le bande di righe (y0, y1) e, per ciascuna, i tasselli (x0, x1).
+    """
+    for y0 in range(0, height, tile_size):
+        y1 = min(y0 + tile_size, height)
+        yield y0, y1, [(x0, min(x0 + tile_size, width)) for x0 in range(0, width, tile_size)]
+
+
+def filter_region(source, filtri, y0, y1, x0, x1, halo, run=None):
+    """
+    Filtra la regione [y0:y1, x0:x1] di `source` leggendola con `halo` pixel
+    di bordo (dove l'immagine li ha) e restituisce solo la regione richiesta.
+    L'angolo della lettura viene allineato a chain_alignment(filtri).
+    run(tile): funzione che filtra il tassello al posto di apply_chain (es.
+    Pipeline.run, che fonde i passi lineari).
+    """
+    height, width = source.shape[:2]
+    align = chain_alignment(filtri)
+    top, left = max(0, y0 - halo) // align * align, max(0, x0 - halo) // align * align
+    bottom, right = min(height, y1 + halo), min(width, x1 + halo)
+
+    tile = np.array(source[top:bottom, left:right])
+    filtered = run(tile) if run is not None else apply_chain(tile, filtri)
+    return filtered[y0 - top:y1 - top, x0 - left:x1 - left]
+
+
+def process_tiled(source, filtri, output=None, tile_size=512, progress=None):
+    """
+    Applica una catena di filtri a tasselli, leggendo ogni tassello con un
+    bordo pari a chain_radius(filtri) e scrivendo solo la parte centrale.
+    - source: array (H, W) o (H, W, C) che si può leggere a fette, ad esempio
+      un np.memmap: viene letto un tassello (con bordo) alla volta
+    - output: array di destinazione della stessa forma (es. np.memmap) oppure
+      un oggetto con write_rows(band) come TiffStripWriter; se None viene
+      creato un array in memoria
+    - progress(done, total): chiamata dopo ogni tassello; un'eccezione
+      sollevata dalla callback interrompe l'elaborazione
+    Il risultato è identico a quello sull'immagine intera, perché ai bordi
+    dell'immagine i filtri vedono lo stesso padding 'edge' e all'interno il
+    bordo contiene tutti i pixel che servono. Fa eccezione il bilaterale
+    approssimato (tolerance), la cui griglia dipende dall'intera immagine.
+    """
+    height, width = source.shape[:2]
+    halo = chain_radius(filtri)
+    total = -(-height // tile_size) * -(-width // tile_size)
+    done = 0
+
+    for y0, y1, tiles in iter_tiles(height, width, tile_size):
+        band = None
+        for x0, x1 in tiles:
+            filtered = filter_region(source, filtri, y0, y1, x0, x1, halo)
+
+            if band is None:
+                band = np.empty((y1 - y0, width) + filtered.shape[2:], dtype=filtered.dtype)
+                if output is None:
+                    output = np.empty((height, width) + filtered.shape[2:], dtype=filtered.dtype)
+            band[:, x0:x1] = filtered
+            done += 1
+            if progress is not None:
+                progress(done, total)
+
+        if hasattr(output, "write_rows"):
+            output.write_rows(band)
+        else:
+            output[y0:y1] = band
+
+    return output
+
+
+def open_source(path):
+    """
+    Apre l'immagine di ingresso: i file .npy vengono mappati in memoria
+    (np.load con mmap_mode='r'), gli altri formati vengono decodificati.
+    """
+    if path.lower().endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    return load_image(path)
+
+
+class TiffStripWriter:
+    """
+    Scrive un TIFF non compresso a strisce di righe, man mano che arrivano:
+    in memoria resta solo la striscia corrente. Supporta immagini uint8 in
+    scala di grigi o RGB, anche con alfa (2 e 4 canali, tag ExtraSamples),
+    fino a 4 GB (TIFF classico).
+    """
+
+    def __init__(self, path, width, height, channels=1):
+        if channels not in (1, 2, 3, 4):
+            raise ValueError("Sono supportate immagini da 1 a 4 canali")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.row_bytes = width * channels
+        if 8 + self.row_bytes * height > 2**32 - 1024:
+            raise ValueError("Immagine troppo grande per un TIFF classico (> 4 GB)")
+        self.rows_written = 0
+        self.rows_per_strip = None
+        self.file = open(path, "wb")
+        # Intestazione: l'offset dell'IFD viene scritto alla chiusura
+        self.file.write(b"II" + struct.pack("<HI", 42, 0))
+
+    def write_rows(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=np.uint8)
+        if rows.shape[1] != self.width or (rows.shape[2] if rows.ndim == 3 else 1) != self.channels:
+            raise ValueError("Forma delle righe non compatibile con l'immagine")
+        if self.rows_per_strip is None:
+            self.rows_per_strip = len(rows)
+        self.file.write(rows.tobytes())
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.rows_written != self.height:
+            self.file.close()
+            raise ValueError(f"Scritte {self.rows_written} righe su {self.height}")
+
+        # Le strisce sono contigue dopo l'intestazione: gli offset si calcolano
+        rows_per_strip = self.rows_per_strip or self.height
+        strip_bytes = rows_per_strip * self.row_bytes
+        n_strips = -(-self.height // rows_per_strip)
+        offsets = [8 + s * strip_bytes for s in range(n_strips)]
+        counts = [min(strip_bytes, self.height * self.row_bytes - s * strip_bytes) for s in range(n_strips)]
+
+        position = self.file.tell()
+        if position % 2:
+            self.file.write(b"\0")
+            position += 1
+
+        extra = b""
+
+        def array_entry(tag, type_code, fmt, values):
+            # Valori che non stanno nei 4 byte della voce vanno dopo l'IFD
+            nonlocal extra
+            data = struct.pack("<" + fmt * len(values), *values)
+            if len(data) <= 4:
+                return struct.pack("<HHI", tag, type_code, len(values)) + data.ljust(4, b"\0")
+            offset = extra_start + len(extra)
+            extra += data
+            return struct.pack("<HHII", tag, type_code, len(values), offset)
+
+        SHORT, LONG = 3, 4
+        # Il canale in più di grigi + alfa e RGBA è un alfa non premoltiplicato
+        alpha = self.channels in (2, 4)
+        n_entries = 11 if alpha else 10
+        extra_start = position + 2 + n_entries * 12 + 4
+        entries = [
+            array_entry(256, LONG, "I", [self.width]),
+            array_entry(257, LONG, "I", [self.height]),
+            array_entry(258, SHORT, "H", [8] * self.channels),
+            array_entry(259, SHORT, "H", [1]),
+            array_entry(262, SHORT, "H", [2 if self.channels >= 3 else 1]),
+            array_entry(273, LONG, "I", offsets),
+            array_entry(277, SHORT, "H", [self.channels]),
+            array_entry(278, LONG, "I", [rows_per_strip]),
+            array_entry(279, LONG, "I", counts),
+            array_entry(284, SHORT, "H", [1]),
+        ] + ([array_entry(338, SHORT, "H", [2])] if alpha else [])
+        self.file.write(struct.pack("<H", n_entries) + b"".join(entries) + struct.pack("<I", 0) + extra)
+
+        self.file.seek(4)
+        self.file.write(struct.pack("<I", position))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+
+def filter_file_tiled(input_path, filtri, output_path, tile_size=512):
+    """
+    Filtra un file immagine a tasselli senza tenere in memoria l'immagine
+    di uscita intera:
+    - output .npy: np.memmap scritto tassello per tassello
+    - output .tif/.tiff: TIFF scritto a strisce man mano che finiscono
+    - altri formati: risultato in memoria e salvataggio con PIL
+    Con ingresso .npy anche la lettura è a tasselli (memory map).
+    """
+    source = open_source(input_path)
+    height, width = source.shape[:2]
+    extension = os.path.splitext(output_path)[1].lower()
+
+    if extension == ".npy":
+        output = np.lib.format.open_memmap(output_path, mode="w+", dtype=source.dtype, shape=source.shape)
+        process_tiled(source, filtri, output, tile_size)
+        output.flush()
+    elif extension in (".tif", ".tiff"):
+        channels = source.shape[2] if source.ndim == 3 else 1
+        with TiffStripWriter(output_path, width, height, channels) as writer:
+            process_tiled(source, filtri, writer, tile_size)
+    else:
+        save_image(process_tiled(source, filtri, tile_size=tile_size), output_path)
+
+    return output_path
@@ -15,10 +15,28 @@ def save_image(image_array, path):
     Salva un array NumPy come immagine.
   
     """
-    image_array = image_array.astype(np.uint8)
+    # copy=False: nessuna copia se l'immagine è già uint8
+    image_array = image_array.astype(np.uint8, copy=False)
     image = Image.fromarray(image_array)
     image.save(path)
 
+def psnr(reference, image, max_value=255.0):
+    """
+    Calcola il PSNR (in dB) di un'immagine rispetto a quella di riferimento.
+    """
+    mse = np.mean((reference.astype(np.float64) - image.astype(np.float64)) ** 2)
+    if mse == 0:
+        return float("inf")
+    return 10 * np.log10(max_value**2 / mse)
+
+def stats(img):
+    """
+    Media e varianza di ogni canale: [(media, varianza), ...].
+    """
+    if img.ndim == 2:
+        return [(np.mean(img), np.var(img))]
+    return [(np.mean(img[:, :, c]), np.var(img[:, :, c])) for c in range(img.shape[2])]
+
 def create_output_folder(folder_name="output"):
     """
     Crea la cartella di output se non esiste già.